@@ -0,0 +1,170 @@
+import os
+import json
+import hashlib
+import numpy as np
+import mpi4py
+from firedrake.petsc import PETSc
+
+
+class CachedMatrix(object):
+    r""" Thin wrapper around a PETSc matrix loaded from the cache, which
+    exposes the same ``handle`` attribute as an assembled matrix.
+
+    :param handle: The PETSc.Mat.
+    """
+
+    def __init__(self, handle):
+        self.handle = handle
+
+
+def cache_dir(name):
+    r""" Return (and create if needed) a sub-directory of Seigen's
+    persistent cache. The cache root defaults to ``~/.cache/seigen``
+    and may be overridden with the ``SEIGEN_CACHE_DIR`` environment
+    variable.
+
+    :param str name: The name of the sub-directory.
+    :returns: The path to the cache sub-directory.
+    """
+    root = os.environ.get('SEIGEN_CACHE_DIR',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'seigen'))
+    path = os.path.join(root, name)
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+    return path
+
+
+def cache_key(*args):
+    r""" Compute a hash key from the string representation of the arguments. """
+    return hashlib.sha1(repr(args).encode()).hexdigest()
+
+
+def mesh_signature(mesh):
+    r""" Compute a signature of a mesh that identifies its topology,
+    coordinates, numbering and parallel partitioning. Each rank hashes
+    its local coordinates and cell-node map, and the resulting digests
+    are combined across the mesh communicator.
+
+    :param mesh: Any Firedrake-compatible mesh.
+    :returns: A hex digest that is identical on all ranks.
+    """
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(mesh.coordinates.dat.data_ro).tobytes())
+    h.update(np.ascontiguousarray(mesh.coordinates.cell_node_map().values).tobytes())
+    digests = mesh.comm.allgather(h.hexdigest())
+    return cache_key(mesh.comm.size, digests)
+
+
+def plex_signature(mesh):
+    r""" Compute a signature of a mesh from its DMPlex, which identifies
+    the mesh before it is initialised, and hence independently of any
+    halo depth or reordering applied during initialisation.
+
+    :param mesh: Any Firedrake-compatible mesh.
+    :returns: A hex digest that is identical on all ranks.
+    """
+    plex = mesh.topology._plex
+    h = hashlib.sha1()
+    h.update(repr(plex.getChart()).encode())
+    h.update(np.ascontiguousarray(plex.getCoordinatesLocal().array).tobytes())
+    digests = mesh.comm.allgather(h.hexdigest())
+    return cache_key(mesh.comm.size, digests)
+
+
+def load_arrays(comm, key):
+    r""" Collectively load the per-rank arrays stored under a key.
+
+    :param comm: The communicator the arrays were stored on.
+    :param str key: The cache key.
+    :returns: A dict of numpy arrays, or None unless all ranks hit.
+    """
+    path = os.path.join(cache_dir('arrays'), '%s_%d.npz' % (key, comm.rank))
+    if not comm.allreduce(int(os.path.exists(path)), op=mpi4py.MPI.MIN):
+        return None
+    with np.load(path) as f:
+        return dict(f.items())
+
+
+def store_arrays(comm, key, **arrays):
+    r""" Store per-rank arrays under a key.
+
+    :param comm: The communicator of the arrays.
+    :param str key: The cache key.
+    :param arrays: The named numpy arrays to store.
+    """
+    path = os.path.join(cache_dir('arrays'), '%s_%d.npz' % (key, comm.rank))
+    np.savez(path, **arrays)
+
+
+def load_matrix(comm, key, sizes):
+    r""" Collectively load a PETSc matrix stored under a key.
+
+    :param comm: The communicator of the matrix.
+    :param str key: The cache key.
+    :param sizes: The (local, global) row and column sizes of the matrix.
+    :returns: A :class:`CachedMatrix`, or None if the key is not cached.
+    """
+    path = os.path.join(cache_dir('matrices'), '%s.dat' % key)
+    if not comm.bcast(os.path.exists(path), root=0):
+        return None
+    viewer = PETSc.Viewer().createBinary(path, mode='r', comm=comm)
+    matrix = PETSc.Mat().create(comm=comm)
+    matrix.setSizes(sizes)
+    matrix.setType('aij')
+    matrix.load(viewer)
+    viewer.destroy()
+    return CachedMatrix(matrix)
+
+
+def store_matrix(comm, key, matrix):
+    r""" Collectively store a PETSc matrix under a key.
+
+    :param comm: The communicator of the matrix.
+    :param str key: The cache key.
+    :param matrix: The PETSc.Mat to store.
+    """
+    path = os.path.join(cache_dir('matrices'), '%s.dat' % key)
+    viewer = PETSc.Viewer().createBinary(path, mode='w', comm=comm)
+    matrix.view(viewer)
+    viewer.destroy()
+
+
+def load_tuning(comm, key):
+    r""" Look up a tuned configuration in the tuning database.
+
+    :param comm: The communicator of the solver.
+    :param str key: The cache key.
+    :returns: A dict of options, or None if the key is not recorded.
+    """
+    config = None
+    if comm.rank == 0:
+        path = os.path.join(cache_dir('tuning'), 'tuning.json')
+        if os.path.exists(path):
+            with open(path) as f:
+                config = json.load(f).get(key)
+    return comm.bcast(config, root=0)
+
+
+def store_tuning(comm, key, config):
+    r""" Record a tuned configuration in the tuning database, unless a
+    faster configuration has already been recorded under the same key.
+
+    :param comm: The communicator of the solver.
+    :param str key: The cache key.
+    :param dict config: The options, including the measured ``time``.
+    """
+    if comm.rank == 0:
+        path = os.path.join(cache_dir('tuning'), 'tuning.json')
+        database = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                database = json.load(f)
+        if key in database and database[key]['time'] <= config['time']:
+            return
+        database[key] = config
+        with open(path + '.tmp', 'w') as f:
+            json.dump(database, f, indent=2, sort_keys=True)
+        os.rename(path + '.tmp', path)
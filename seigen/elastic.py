@@ -4,13 +4,21 @@ from pyop2 import *
 from pyop2.profiling import timed_region
 from pyop2.base import _trace
 from firedrake import *
-from firedrake.petsc import PETSc
 from seigen.helpers import log
+from seigen.tiling import Autotuner, derive_schemes, rank_schemes, \
+    tile_cells, tile_footprint, working_set
+from seigen.cache import cache_key, mesh_signature, plex_signature, load_arrays, store_arrays, \
+    load_matrix, store_matrix, load_tuning, store_tuning
+import os
 import mpi4py
 from abc import ABCMeta, abstractmethod
 import numpy as np
 import coffee.base as ast
+import tsfc
+import ufl
+from ufl.algorithms import estimate_total_polynomial_degree
 from contextlib import contextmanager
+import time
 
 
 class ElasticLF4(object):
@@ -25,7 +33,7 @@ class ElasticLF4(object):
     __metaclass__ = ABCMeta
 
     @staticmethod
-    def create(mesh, family, degree, dimension, solver="explicit", output=True):
+    def create(mesh, family, degree, dimension, solver="explicit", output=True, **kwargs):
         r""" Create an elastic wave equation solver for the given mesh
         according to specified spatial discretisation details and
         solver methods.
@@ -37,33 +45,64 @@ class ElasticLF4(object):
             'implicit': Use PETSc KSP solver to solve for the solution fields.
             'explicit': Explicitly invert the mass matrix and perform a
                         matrix-vector multiplication using PETSc MatMult.
+            'operator': Pre-assemble the RHS operators, pre-multiplied by the
+                        inverse mass matrix, so that each stage is a sequence
+                        of sparse matrix-vector products using PETSc MatMult.
             'parloop': Explicitly invert the mass matrix and perform a
                        matrix-vector multiplication using a PyOP2 Parloop.
+            'fused': Apply the cell-local inverse mass matrix inside the
+                     RHS assembly kernels, so that no intermediate RHS
+                     vector is assembled (DG only).
             'fusion': Experimental mode that enables PyOP2 kernel fusion
                       to fuse cell and facet loops.
             'tiling': Experimental mode that activates loop tiling via
                       PyOP2 and SLOPE.
         :param int dimension: The spatial dimension of the problem (1, 2 or 3).
         :param bool output: If True, output the solution fields to a file.
+        :param kwargs: Further solver-specific options; see the
+            documentation of the according solver class.
         :returns: None
         """
         if solver == "implicit":
-            return ImplicitElasticLF4(mesh, family, degree, dimension, output=output)
+            return ImplicitElasticLF4(mesh, family, degree, dimension, output=output, **kwargs)
         elif solver == "explicit":
-            return ExplicitElasticLF4(mesh, family, degree, dimension, output=output)
+            return ExplicitElasticLF4(mesh, family, degree, dimension, output=output, **kwargs)
+        elif solver == "operator":
+            return OperatorElasticLF4(mesh, family, degree, dimension, output=output, **kwargs)
         elif solver == "parloop":
             return TilingElasticLF4(mesh, family, degree, dimension,
-                                    output=output, tiling_mode=None)
+                                    output=output, tiling_mode=None, **kwargs)
+        elif solver == "fused":
+            kwargs.setdefault('fuse_invmass', True)
+            return TilingElasticLF4(mesh, family, degree, dimension,
+                                    output=output, tiling_mode=None, **kwargs)
         elif solver == 'fusion':
             return TilingElasticLF4(mesh, family, degree, dimension,
-                                    output=output, tiling_mode="hard")
+                                    output=output, tiling_mode="hard", **kwargs)
         elif solver == 'tiling':
             return TilingElasticLF4(mesh, family, degree, dimension,
-                                    output=output, tiling_mode="tile")
+                                    output=output, tiling_mode="tile", **kwargs)
         else:
-            raise ValueError("Unknown solver mode. Must be one of: implicit, explicit, parloop")
-
-    def __init__(self, mesh, family, degree, dimension, output=True):
+            raise ValueError("Unknown solver mode. Must be one of: implicit, explicit, operator, parloop, fused, fusion, tiling")
+
+    #: The stages of one LF4 timestep in execution order, given as the
+    #: field that is solved for, its function space and the fields its
+    #: RHS depends on.
+    stages = (("uh1", "U", ("s0", "u0")),
+              ("stemp", "S", ("uh1",)),
+              ("uh2", "U", ("stemp", "u0")),
+              ("u1", "U", ("u0", "uh1", "uh2")),
+              ("sh1", "S", ("u1",)),
+              ("utemp", "U", ("sh1", "u1")),
+              ("sh2", "S", ("utemp",)),
+              ("s1", "S", ("s0", "sh1", "sh2")))
+
+    #: The fields whose values are carried across timesteps.
+    persistent = ("s0", "s1", "u0", "u1")
+
+    def __init__(self, mesh, family, degree, dimension, output=True, low_memory=False,
+                 symmetric_stress=False, quadrature_degree=None, flux='split',
+                 split_absorption=False):
         r""" Initialise a new elastic wave simulation.
 
         :param mesh: The underlying computational mesh of vertices and edges.
@@ -71,18 +110,52 @@ class ElasticLF4(object):
         :param int degree: Use polynomial basis functions of this degree.
         :param int dimension: The spatial dimension of the problem (1, 2 or 3).
         :param bool output: If True, output the solution fields to a file.
+        :param bool low_memory: If True, temporary fields with disjoint
+            lifetimes share the same buffer, and the PyOP2-level
+            solvers share one RHS buffer per function space. This
+            introduces write-after-read dependencies between stages.
+        :param bool symmetric_stress: If True, store only the
+            d(d+1)/2 independent components of the (symmetric) stress
+            tensor.
+        :param quadrature_degree: The quadrature degree of all forms, or
+            a dict mapping the names of forms (e.g. 'uh1', 'sh2') and of
+            the 'absorption' and 'source' terms to quadrature degrees.
+            Forms and terms without a given degree use the degree
+            estimated by UFL.
+        :param str flux: The form of the interior facet terms:
+            'split': One term per side of the facet and, for the stress,
+                     per material parameter.
+            'consolidated': A single term per equation, which evaluates
+                            the numerical flux once per facet and pairs
+                            it with the jump of the test function.
+        :param bool split_absorption: If True, remove the absorption term
+            from the velocity stages, and instead damp the velocity field
+            by the exact solution of the absorption term after each
+            timestep (operator splitting). This is not supported with
+            fusion or tiling of unrolled timesteps.
         :returns: None
         """
         with timed_region('function setup'):
             self.mesh = mesh
+            self.family = family
+            self.degree = degree
             self.dimension = dimension
             self.output = output
-
-            self.S = TensorFunctionSpace(mesh, family, degree, name='S')
+            self.low_memory = low_memory
+            self.quadrature_degree = quadrature_degree
+            if flux not in ('split', 'consolidated'):
+                raise ValueError("Unknown flux. Must be one of: split, consolidated")
+            self.flux = flux
+            self.split_absorption = split_absorption
+
+            self.S = TensorFunctionSpace(mesh, family, degree, name='S',
+                                         symmetry=True if symmetric_stress else None)
             self.U = VectorFunctionSpace(mesh, family, degree, name='U')
 
             # Assumes that the S and U function spaces are the same.
             dofs = self.mesh.comm.allreduce(self.S.dof_count, op=mpi4py.MPI.SUM)
+            if symmetric_stress:
+                log("Storing %d stress components per node" % self.S.dof_dset.cdim)
             log("Number of degrees of freedom: %d" % dofs)
 
             self.s = TrialFunction(self.S)
@@ -90,17 +163,26 @@ class ElasticLF4(object):
             self.u = TrialFunction(self.U)
             self.w = TestFunction(self.U)
 
-            self.s0 = Function(self.S, name="StressOld")
-            self.sh1 = Function(self.S, name="StressHalf1")
-            self.stemp = Function(self.S, name="StressTemp")
-            self.sh2 = Function(self.S, name="StressHalf2")
-            self.s1 = Function(self.S, name="StressNew")
+            # Number and size of fields allocated by the solver
+            self.allocations = 0
+            self.timestep_allocations = 0
+            self.allocated_bytes = 0
+
+            # Temporaries may share buffers in low-memory mode
+            self.aliases = self.alias_buffers() if self.low_memory else {}
+            self.buffers = {}
 
-            self.u0 = Function(self.U, name="VelocityOld")
-            self.uh1 = Function(self.U, name="VelocityHalf1")
-            self.utemp = Function(self.U, name="VelocityTemp")
-            self.uh2 = Function(self.U, name="VelocityHalf2")
-            self.u1 = Function(self.U, name="VelocityNew")
+            self.s0 = self.buffer("s0", self.S, name="StressOld")
+            self.sh1 = self.buffer("sh1", self.S, name="StressHalf1")
+            self.stemp = self.buffer("stemp", self.S, name="StressTemp")
+            self.sh2 = self.buffer("sh2", self.S, name="StressHalf2")
+            self.s1 = self.buffer("s1", self.S, name="StressNew")
+
+            self.u0 = self.buffer("u0", self.U, name="VelocityOld")
+            self.uh1 = self.buffer("uh1", self.U, name="VelocityHalf1")
+            self.utemp = self.buffer("utemp", self.U, name="VelocityTemp")
+            self.uh2 = self.buffer("uh2", self.U, name="VelocityHalf2")
+            self.u1 = self.buffer("u1", self.U, name="VelocityNew")
 
             self.absorption_function = None
             self.source_function = None
@@ -117,6 +199,9 @@ class ElasticLF4(object):
             self.invmass_velocity = None
             self.invmass_stress = None
 
+            # Pointwise damping factors of the split absorption term
+            self.damping = None
+
         if self.output:
             with timed_region('i/o'):
                 # File output streams
@@ -135,9 +220,13 @@ class ElasticLF4(object):
 
     @absorption.setter
     def absorption(self, expression):
-        r""" Setter function for the absorption field.
+        r""" Setter function for the absorption field. Unless an
+        absorption field has been provided, the absorption coefficient
+        is piecewise constant (DG0).
         :param firedrake.Expression expression: The expression to interpolate onto the absorption field.
         """
+        if self.absorption_function is None:
+            self.absorption_function = Function(FunctionSpace(self.mesh, "DG", 0), name="Absorption")
         self.absorption_function.interpolate(expression)
 
     # Source term
@@ -203,21 +292,151 @@ class ElasticLF4(object):
 
     def f(self, w, s0, u0, n, absorption=None):
         """ The RHS of the velocity equation. """
-        f = -inner(grad(w), s0)*dx + inner(avg(s0)*n('+'), w('+'))*dS + inner(avg(s0)*n('-'), w('-'))*dS
-        if(absorption):
-            f += -inner(w, absorption*u0)*dx
+        if self.flux == 'consolidated':
+            # n('-') == -n('+'), so both sides share one flux
+            f = -inner(grad(w), s0)*dx + inner(avg(s0)*n('+'), jump(w))*dS
+        else:
+            f = -inner(grad(w), s0)*dx + inner(avg(s0)*n('+'), w('+'))*dS + inner(avg(s0)*n('-'), w('-'))*dS
+        if(absorption and not self.split_absorption):
+            f += -inner(w, absorption*u0)*self.term_measure(dx, 'absorption')
         return f
 
     def g(self, v, u1, I, n, l, mu, source=None):
         """ The RHS of the stress equation. """
-        g = - l*(v[i, j]*I[i, j]).dx(k)*u1[k]*dx + l*(jump(v[i, j], n[k])*I[i, j]*avg(u1[k]))*dS \
-            + l*(v[i, j]*I[i, j]*u1[k]*n[k])*ds - mu*inner(div(v), u1)*dx + mu*inner(avg(u1), jump(v, n))*dS \
-            - mu*inner(div(v.T), u1)*dx + mu*inner(avg(u1), jump(v.T, n))*dS \
-            + mu*inner(u1, dot(v, n))*ds + mu*inner(u1, dot(v.T, n))*ds
+        if self.flux == 'consolidated':
+            # The traction of the averaged velocity on the '+' side,
+            # paired with the jump of the test function
+            u = avg(u1)
+            flux = l*dot(u, n('+'))*I + mu*(outer(u, n('+')) + outer(n('+'), u))
+            g = - l*(v[i, j]*I[i, j]).dx(k)*u1[k]*dx - mu*inner(div(v), u1)*dx - mu*inner(div(v.T), u1)*dx \
+                + inner(flux, jump(v))*dS \
+                + l*(v[i, j]*I[i, j]*u1[k]*n[k])*ds + mu*inner(u1, dot(v, n))*ds + mu*inner(u1, dot(v.T, n))*ds
+        else:
+            g = - l*(v[i, j]*I[i, j]).dx(k)*u1[k]*dx + l*(jump(v[i, j], n[k])*I[i, j]*avg(u1[k]))*dS \
+                + l*(v[i, j]*I[i, j]*u1[k]*n[k])*ds - mu*inner(div(v), u1)*dx + mu*inner(avg(u1), jump(v, n))*dS \
+                - mu*inner(div(v.T), u1)*dx + mu*inner(avg(u1), jump(v.T, n))*dS \
+                + mu*inner(u1, dot(v, n))*ds + mu*inner(u1, dot(v.T, n))*ds
         if(source):
-            g += inner(v, source)*dx
+            g += inner(v, source)*self.term_measure(dx, 'source')
         return g
 
+    def term_measure(self, measure, term):
+        r""" The measure of a RHS term, carrying its quadrature degree
+        if one has been given for the term.
+        :param measure: The UFL measure.
+        :param str term: The name of the term.
+        :returns: The UFL measure of the term."""
+        if isinstance(self.quadrature_degree, dict) and term in self.quadrature_degree:
+            return measure(metadata={'quadrature_degree': self.quadrature_degree[term]})
+        return measure
+
+    def quadrature(self, form, name):
+        r""" Apply the quadrature degree given for a form to all of its
+        integrals without a degree of their own, and log the degree of
+        each integral, whether given or estimated by UFL.
+        :param ufl.Form form: The form.
+        :param str name: The name of the form, e.g. 'uh1'.
+        :returns: The form with the quadrature degrees applied."""
+        degree = self.quadrature_degree
+        if isinstance(degree, dict):
+            degree = degree.get(name)
+        integrals = []
+        report = []
+        for integral in form.integrals():
+            metadata = integral.metadata()
+            if degree is not None and 'quadrature_degree' not in metadata:
+                metadata = dict(metadata, quadrature_degree=degree)
+                integral = integral.reconstruct(metadata=metadata)
+            if 'quadrature_degree' in metadata:
+                report.append("%s %d" % (integral.integral_type(), metadata['quadrature_degree']))
+            else:
+                estimated = estimate_total_polynomial_degree(integral.integrand())
+                report.append("%s %d (estimated)" % (integral.integral_type(), estimated))
+            integrals.append(integral)
+        log("Quadrature degrees of form %s: %s" % (name, ", ".join(report)))
+        return ufl.Form(integrals)
+
+    def allocate(self, functionspace, name=None):
+        r""" Allocate a new field, counting the number of allocations.
+        :param functionspace: The function space of the field.
+        :param str name: The name of the field.
+        :returns: A new firedrake.Function."""
+        self.allocations += 1
+        f = Function(functionspace, name=name)
+        self.allocated_bytes += f.dat.nbytes
+        return f
+
+    @contextmanager
+    def count_allocations(self):
+        r""" Context manager that counts every PyOP2 Dat, and hence every
+        field, allocated within its scope in ``timestep_allocations``,
+        whether it is allocated by Seigen, Firedrake or PyOP2."""
+        from pyop2 import base
+        init = base.Dat.__dict__['__init__']
+
+        def counting_init(dat, *args, **kwargs):
+            self.timestep_allocations += 1
+            init(dat, *args, **kwargs)
+        base.Dat.__init__ = counting_init
+        try:
+            yield
+        finally:
+            base.Dat.__init__ = init
+
+    def alias_buffers(self):
+        r""" Assign the temporary fields of the LF4 stages to as few
+        buffers as possible. The live range of a temporary spans from
+        the stage that solves for it to the last stage reading it, and
+        temporaries on the same function space share a buffer if their
+        live ranges do not overlap (first-fit in stage order).
+        :returns: A dict mapping each temporary to the name of the
+            temporary that owns its buffer."""
+        live = {}
+        for i, (result, _, reads) in enumerate(self.stages):
+            live.setdefault(result, [i, i])
+            for field in reads:
+                if field in live:
+                    live[field][1] = i
+
+        aliases = {}
+        buffers = []
+        for result, space, _ in self.stages:
+            if result in self.persistent:
+                continue
+            start, end = live[result]
+            for buf in buffers:
+                if buf[0] == space and buf[2] < start:
+                    buf[2] = end
+                    aliases[result] = buf[1]
+                    break
+            else:
+                buffers.append([space, result, end])
+                aliases[result] = result
+        return aliases
+
+    def buffer(self, field, functionspace, name=None):
+        r""" Return the buffer holding a field, allocating it unless it
+        is shared with a temporary whose buffer already exists.
+        :param str field: The name of the field in the LF4 stages.
+        :param functionspace: The function space of the field.
+        :param str name: The name of the buffer if newly allocated.
+        :returns: A firedrake.Function."""
+        owner = self.aliases.get(field, field)
+        if owner not in self.buffers:
+            self.buffers[owner] = self.allocate(functionspace, name=name)
+        return self.buffers[owner]
+
+    def swap(self, a, b):
+        r""" Swap the data of two fields on the same function space.
+        Forms and kernels are bound to the fields rather than to their
+        data, so this advances time levels without copying any values.
+        :param firedrake.Function a: The first field.
+        :param firedrake.Function b: The second field.
+        :returns: None"""
+        a.topological.dat, b.topological.dat = b.topological.dat, a.topological.dat
+        # Function caches attributes of its topological counterpart
+        a.dat, b.dat = a.topological.dat, b.topological.dat
+
     def write(self, u=None, s=None):
         r""" Write the velocity and/or stress fields to file.
         :param firedrake.Function u: The velocity field.
@@ -245,14 +464,16 @@ class ElasticLF4(object):
         r""" Generate method-specific solver contexts for all forms."""
         log("Creating solver contexts")
         with timed_region('solver setup'):
-            self.ctx_uh1 = self.create_solver(self.form_uh1, self.uh1)
-            self.ctx_stemp = self.create_solver(self.form_stemp, self.stemp)
-            self.ctx_uh2 = self.create_solver(self.form_uh2, self.uh2)
-            self.ctx_u1 = self.create_solver(self.form_u1, self.u1)
-            self.ctx_sh1 = self.create_solver(self.form_sh1, self.sh1)
-            self.ctx_utemp = self.create_solver(self.form_utemp, self.utemp)
-            self.ctx_sh2 = self.create_solver(self.form_sh2, self.sh2)
-            self.ctx_s1 = self.create_solver(self.form_s1, self.s1)
+            self.ctx_uh1 = self.create_solver(self.quadrature(self.form_uh1, 'uh1'), self.uh1, 'uh1')
+            self.ctx_stemp = self.create_solver(self.quadrature(self.form_stemp, 'stemp'), self.stemp, 'stemp')
+            self.ctx_uh2 = self.create_solver(self.quadrature(self.form_uh2, 'uh2'), self.uh2, 'uh2')
+            self.ctx_u1 = self.create_solver(self.quadrature(self.form_u1, 'u1'), self.u1, 'u1')
+            self.ctx_sh1 = self.create_solver(self.quadrature(self.form_sh1, 'sh1'), self.sh1, 'sh1')
+            self.ctx_utemp = self.create_solver(self.quadrature(self.form_utemp, 'utemp'), self.utemp, 'utemp')
+            self.ctx_sh2 = self.create_solver(self.quadrature(self.form_sh2, 'sh2'), self.sh2, 'sh2')
+            self.ctx_s1 = self.create_solver(self.quadrature(self.form_s1, 's1'), self.s1, 's1')
+        if self.split_absorption and self.absorption:
+            self.create_damping()
 
     @property
     def loop_context(self):
@@ -264,44 +485,108 @@ class ElasticLF4(object):
             yield
         return empty_loop_context
 
-    def run(self, T):
+    def solve_stages(self):
+        r""" Issue the solves of all stages of a single timestep.
+        :returns: None"""
+        # Solve for the velocity vector field.
+        with timed_region('velocity solve'):
+            self.solve(self.ctx_uh1, self.invmass_velocity, self.uh1)
+            self.solve(self.ctx_stemp, self.invmass_stress, self.stemp)
+            self.solve(self.ctx_uh2, self.invmass_velocity, self.uh2)
+            self.solve(self.ctx_u1, self.invmass_velocity, self.u1)
+
+        # Solve for the stress tensor field.
+        with timed_region('stress solve'):
+            self.solve(self.ctx_sh1, self.invmass_stress, self.sh1)
+            self.solve(self.ctx_utemp, self.invmass_velocity, self.utemp)
+            self.solve(self.ctx_sh2, self.invmass_stress, self.sh2)
+            self.solve(self.ctx_s1, self.invmass_stress, self.s1)
+
+    def update_source(self, t):
+        r""" Update a time-dependent source term to time t.
+        :param float t: The current time.
+        :returns: None"""
+        if(self.source):
+            with timed_region('source term update'):
+                self.source_expression.t = t
+                self.source = self.source_expression
+
+    def create_damping(self):
+        r""" Interpolate the damping factors of the split absorption term
+        onto the velocity nodes, and create the kernel applying them.
+        :returns: None"""
+        with timed_region('absorption setup'):
+            damping = Function(FunctionSpace(self.mesh, self.family, self.degree))
+            damping.interpolate(exp(-self.absorption*self.dt/self.density))
+            self.damping = op2.Dat(self.U.node_set, damping.dat.data_ro_with_halos,
+                                   name="Damping")
+            self.damping_kernel = op2.Kernel("""
+void absorb(double *u, double *damping)
+{
+  for (int c = 0; c < %d; c++) u[c] *= damping[0];
+}""" % self.dimension, "absorb")
+
+    def absorb(self):
+        r""" Damp the new velocity field by the exact solution of the
+        absorption term over one timestep, density*du/dt = -absorption*u,
+        which is applied pointwise to the velocity degrees of freedom.
+        :returns: None"""
+        if self.damping is None:
+            return
+        with timed_region('absorption'):
+            op2.par_loop(self.damping_kernel, self.U.node_set,
+                         self.u1.dat(op2.RW), self.damping(op2.READ))
+
+    def timestep(self, t):
+        r""" Issue the parloops advancing the solution fields by a single
+        timestep, without evaluating them.
+        :param float t: The time at the end of the timestep.
+        :returns: None"""
+        with self.loop_context():
+            self.solve_stages()
+
+    def run(self, T, unroll=1):
         """ Run the elastic wave simulation until t = T.
+
+        Timesteps are advanced in chains of ``unroll`` consecutive steps,
+        which are evaluated together, so that solvers may fuse them. The
+        source term is updated, and the solution fields are written,
+        only at the chain boundaries.
+
         :param float T: The finish time of the simulation.
+        :param int unroll: The number of timesteps per chain.
         :returns: The final solution fields for velocity and stress.
         """
+        if unroll < 1:
+            raise ValueError("The unroll factor must be at least 1, got %d" % unroll)
+
         # Write out the initial condition.
         self.write(self.u1, self.s1)
 
         # Call solver-specific setup
         self.setup()
+        log("Memory allocated for fields and buffers: %.2f MB in %d allocations"
+            % (self.allocated_bytes / 1024.0**2, self.allocations))
 
-        with timed_region('timestepping'):
+        self.timestep_allocations = 0
+        with timed_region('timestepping'), self.count_allocations():
             t = self.dt
             while t <= T + 1e-12:
-                log("t = %f" % t)
-
-                with self.loop_context():
-                    # In case the source is time-dependent, update the time 't' here.
-                    if(self.source):
-                        with timed_region('source term update'):
-                            self.source_expression.t = t
-                            self.source = self.source_expression
-
-                    # Solve for the velocity vector field.
-                    with timed_region('velocity solve'):
-                        self.solve(self.ctx_uh1, self.invmass_velocity, self.uh1)
-                        self.solve(self.ctx_stemp, self.invmass_stress, self.stemp)
-                        self.solve(self.ctx_uh2, self.invmass_velocity, self.uh2)
-                        self.solve(self.ctx_u1, self.invmass_velocity, self.u1)
-                    self.u0.assign(self.u1)
-
-                    # Solve for the stress tensor field.
-                    with timed_region('stress solve'):
-                        self.solve(self.ctx_sh1, self.invmass_stress, self.sh1)
-                        self.solve(self.ctx_utemp, self.invmass_velocity, self.utemp)
-                        self.solve(self.ctx_sh2, self.invmass_stress, self.sh2)
-                        self.solve(self.ctx_s1, self.invmass_stress, self.s1)
-                    self.s0.assign(self.s1)
+                # In case the source is time-dependent, update the time 't' here.
+                self.update_source(t)
+
+                for step in range(unroll):
+                    if t > T + 1e-12:
+                        break
+                    log("t = %f" % t)
+                    if step > 0:
+                        # The new fields become the old ones within the chain
+                        self.swap(self.u0, self.u1)
+                        self.swap(self.s0, self.s1)
+                    self.timestep(t)
+                    if self.split_absorption:
+                        self.absorb()
+                    t += self.dt
 
                 # Execute the above scheduled Parloops
                 _trace.evaluate_all()
@@ -309,8 +594,15 @@ class ElasticLF4(object):
                 # Write out the new fields
                 self.write(self.u1, self.s1)
 
-                # Move onto next timestep
-                t += self.dt
+                # Move onto next timestep, the new fields become the old ones
+                self.swap(self.u0, self.u1)
+                self.swap(self.s0, self.s1)
+
+        # Both time levels hold the final solution, as after an assign
+        self.u1.assign(self.u0)
+        self.s1.assign(self.s0)
+
+        log("Allocations during timestepping: %d" % self.timestep_allocations)
 
         return self.u1, self.s1
 
@@ -319,10 +611,11 @@ class ImplicitElasticLF4(ElasticLF4):
     r""" Elastic equation solver that implicitly solves individual UFL
     forms by wrapping them as firedrake.LinearVariatonalProblem().
     """
-    def create_solver(self, form, result):
+    def create_solver(self, form, result, name):
         r""" Create a solver object for a given form.
         :param ufl.Form form: The weak form of the equation that needs solving.
         :param firedrake.Function result: The field that will hold the solution.
+        :param str name: The name of the stage, e.g. 'uh1'.
         :returns: A LinearVariationalSolver object associated with the problem.
         """
         problem = LinearVariationalProblem(lhs(form), rhs(form), result)
@@ -336,7 +629,27 @@ class ExplicitElasticLF4(ElasticLF4):
     r""" Elastic equation solver that explicitly solves individual UFL
     forms by assembling RHS vectors and multiplying them with the
     according global inverse mass matrix.
+
+    With ``cache_invmass=True`` the inverse mass matrices are stored on
+    disk, keyed by the mesh signature (topology, coordinates and
+    partitioning), the discretisation and the function space, and are
+    loaded instead of re-assembled on subsequent runs.
     """
+
+    def __init__(self, *args, **kwargs):
+        self.cache_invmass = kwargs.pop("cache_invmass", False)
+        super(ExplicitElasticLF4, self).__init__(*args, **kwargs)
+        # RHS buffers, one per function space
+        self.rhs_buffers = {}
+
+    def invmass_key(self, functionspace, *args):
+        r""" The on-disk cache key of an inverse mass matrix, which
+        includes the number of stored components per node, since a
+        symmetric stress space has the same name as a full one. """
+        return cache_key(type(self).__name__, mesh_signature(self.mesh), self.family,
+                         self.degree, self.dimension, functionspace.name,
+                         functionspace.dof_dset.cdim, *args)
+
     @property
     def form_u1(self):
         """ UFL for u1 equation. """
@@ -351,17 +664,30 @@ class ExplicitElasticLF4(ElasticLF4):
         return inner(self.v, self.s)*dx - inner(self.v, self.s0)*dx \
             - self.dt*inner(self.v, self.sh1)*dx - ((self.dt**3)/24.0)*inner(self.v, self.sh2)*dx
 
-    def create_solver(self, form, *args):
-        r""" Solution context for explicit methods is the compiled RHS kernel object."""
-        return rhs(form)
-
-    def solve(self, rhs, matrix, result):
+    def create_solver(self, form, result, name):
+        r""" Solution context for explicit methods is the RHS form along
+        with a preallocated buffer for the assembled RHS vector, which
+        is reused in every timestep. Since each RHS is consumed by the
+        solve before the next one is assembled, all stages on the same
+        function space share a buffer."""
+        return rhs(form), self.rhs_buffer(result.function_space())
+
+    def rhs_buffer(self, functionspace):
+        r""" The RHS buffer shared by all stages on a function space.
+        :param functionspace: The function space of the RHS.
+        :returns: A firedrake.Function."""
+        if functionspace.name not in self.rhs_buffers:
+            self.rhs_buffers[functionspace.name] = self.allocate(functionspace, name="RHS")
+        return self.rhs_buffers[functionspace.name]
+
+    def solve(self, ctx, matrix, result):
         r""" Solve by assembling into RHS vector and applying inverse mass matrix.
-        :param rhs: The RHS vector that the inverse mass matrix will be multiplied with.
+        :param ctx: The RHS form and the buffer it is assembled into.
         :param matrix: The inverse mass matrix.
         :param firedrake.Function result: The solution field.
         :returns: None"""
-        F_a = assemble(rhs)
+        rhs, F_a = ctx
+        assemble(rhs, tensor=F_a)
         with result.dat.vec as res:
             with F_a.dat.vec_ro as F_v:
                 matrix.handle.mult(F_v, res)
@@ -373,17 +699,111 @@ class ExplicitElasticLF4(ElasticLF4):
         """
         log("Generating inverse mass matrices")
         # Inverse of the (consistent) mass matrix for the velocity equation.
-        self.inverse_mass_velocity = assemble(inner(self.w, self.u)*dx, inverse=True)
-        self.inverse_mass_velocity.assemble()
-        self.invmass_velocity = self.inverse_mass_velocity.M
+        self.invmass_velocity = self.assemble_inverse_mass(inner(self.w, self.u)*dx, self.U)
         # Inverse of the (consistent) mass matrix for the stress equation.
-        self.inverse_mass_stress = assemble(inner(self.v, self.s)*dx, inverse=True)
-        self.inverse_mass_stress.assemble()
-        self.invmass_stress = self.inverse_mass_stress.M
+        self.invmass_stress = self.assemble_inverse_mass(inner(self.v, self.s)*dx, self.S)
 
         # Setup RHS assembly objects
         super(ExplicitElasticLF4, self).setup()
 
+    def assemble_inverse_mass(self, form, functionspace):
+        r""" Assemble the inverse of a mass matrix, or load it from the
+        on-disk cache if enabled.
+        :param ufl.Form form: The bilinear mass form.
+        :param functionspace: The function space of the mass matrix.
+        :returns: The inverse mass matrix."""
+        if self.cache_invmass:
+            key = self.invmass_key(functionspace)
+            sizes = functionspace.dof_dset.layout_vec.getSizes()
+            matrix = load_matrix(self.mesh.comm, key, (sizes, sizes))
+            if matrix is not None:
+                log("Loaded inverse mass matrix for %s from cache" % functionspace.name)
+                return matrix
+        inverse_mass = assemble(form, inverse=True)
+        inverse_mass.assemble()
+        if self.cache_invmass:
+            store_matrix(self.mesh.comm, key, inverse_mass.M.handle)
+        return inverse_mass.M
+
+
+class OperatorElasticLF4(ExplicitElasticLF4):
+    r""" Elastic equation solver that pre-assembles the linear operators
+    of the individual RHS forms, pre-multiplied by the according inverse
+    mass matrix. Since the coefficients of the forms do not change
+    throughout the simulation, each stage is then reduced to one sparse
+    matrix-vector product per field the RHS depends on, and no form is
+    re-assembled during timestepping.
+    """
+
+    @property
+    def fields(self):
+        r""" The fields that the RHS forms depend on linearly, each of
+        which is listed once, even if it is aliased by several temporaries
+        in low-memory mode. """
+        fields = []
+        for field in (self.s0, self.sh1, self.stemp, self.sh2, self.s1,
+                      self.u0, self.uh1, self.utemp, self.uh2, self.u1):
+            if not any(field is f for f in fields):
+                fields.append(field)
+        if(self.source):
+            fields.append(self.source)
+        return fields
+
+    def inverse_mass(self, result):
+        r""" The inverse mass matrix associated with the space of a field. """
+        if result.function_space() == self.U:
+            return self.invmass_velocity
+        return self.invmass_stress
+
+    def create_solver(self, form, result, name):
+        r""" Solution context for the operator method is a list of
+        (operator, field) pairs, such that the solution is the sum of
+        the operators applied to the according fields.
+        :param ufl.Form form: The weak form of the equation that needs solving.
+        :param firedrake.Function result: The field that will hold the solution.
+        :param str name: The name of the stage, e.g. 'uh1'.
+        :returns: A list of (PETSc.Mat, firedrake.Function) pairs."""
+        L = rhs(form)
+        coefficients = L.coefficients()
+        invmass = self.inverse_mass(result)
+        operators = []
+        for field in self.fields:
+            if field not in coefficients:
+                continue
+            A = assemble(derivative(L, field, TrialFunction(field.function_space())))
+            A.assemble()
+            operators.append((invmass.handle.matMult(A.M.handle), field))
+        return operators
+
+    def solve(self, operators, matrix, result):
+        r""" Solve by accumulating the pre-assembled operators applied to their fields.
+        :param operators: The list of (operator, field) pairs.
+        :param matrix: The inverse mass matrix (unused, already applied).
+        :param firedrake.Function result: The solution field.
+        :returns: None"""
+        with result.dat.vec as res:
+            res.zeroEntries()
+            for A, field in operators:
+                with field.dat.vec_ro as x:
+                    A.multAdd(x, res, res)
+
+
+class AffineInverseMass(object):
+    r""" Compact representation of a block-diagonal inverse mass matrix
+    on an affine simplex mesh. The local mass matrix of each cell is the
+    reference mass matrix scaled by the cell volume, hence the inverse
+    is stored as a single reference block and one scalar per cell.
+
+    :param reference: A pyop2.Global holding the reference inverse block,
+        scaled such that the local inverse is ``reference*scaling``.
+    :param scaling: A piecewise-constant firedrake.Function holding the
+        reciprocal cell volumes.
+    """
+
+    def __init__(self, reference, scaling):
+        self.reference = reference
+        self.scaling = scaling
+
 
 class TilingElasticLF4(ExplicitElasticLF4):
     r""" Experimental elastic equation solver that uses explicit
@@ -393,31 +813,391 @@ class TilingElasticLF4(ExplicitElasticLF4):
     RHSs and the diagonal block entries of the inverse mass matrices,
     which in turn allows us to fuse these into the main loops via
     tiling.
+
+    With ``fuse_invmass=True`` the inverse mass matrix is instead
+    applied inside the RHS assembly kernels. Since the inverse mass
+    matrix is block-diagonal for DG, each cell and facet kernel may
+    apply the local blocks to its own contribution before incrementing
+    the solution field, which removes the intermediate RHS vector.
+
+    With ``precision='mixed'`` the inverse mass matrices are stored in
+    single precision, halving their memory footprint and bandwidth,
+    while the kernels applying them accumulate in double precision.
+    The solution fields remain in double precision, as required by the
+    form assembly kernels.
+
+    With ``replay=True`` the parloops issued during the first timestep
+    are recorded and re-executed directly on subsequent timesteps,
+    which avoids rebuilding forms, kernels and arguments in Python.
+    Since time levels are swapped after every step, one plan is recorded
+    for each of the two time level parities.
+
+    With ``unroll=k`` the fusion and tiling modes fuse k consecutive
+    timesteps into a single loop chain, and the halo depth is increased
+    accordingly.
+
+    The loop chain is further configured by the options ``tile_size``,
+    ``extra_halo``, ``partitioning`` ('chunk' or 'metis', the latter
+    reordering the mesh with metis-rcm), ``fusion_scheme`` (an explicit
+    ``(num_solves, [(first, last, tile_size), ...])`` schedule, or
+    'auto' to derive the schedule from the loop chain of a timestep),
+    ``use_glb_maps``, ``use_prefetch``, ``coloring`` and ``log``.
+    Derived schemes and autotuning candidates whose tiles exceed
+    ``cache_size`` bytes, according to the tile footprint model, are
+    discarded. The footprint of a configuration can also be predicted
+    before running with :meth:`predict_footprint`.
+
+    With ``batch_width=W`` the parloop mode applies the inverse mass
+    matrices to batches of W cells at a time, with the loop over the
+    cells of a batch innermost, so that the tiny per-cell mat-vec
+    products of low-order discretisations vectorise across cells. With
+    ``batch_width=True`` the width is the number of doubles per vector
+    register of the target ISA.
+
+    With ``layout='soa'`` the parloop mode applies a single scalar
+    inverse mass matrix to each component of the velocity and stress
+    fields, using kernels that transpose the interleaved local data into
+    component-contiguous arrays.
+
+    With ``subsets=True`` the absorption and source terms are split off
+    the RHS forms and assembled over the cells on which their
+    coefficients are nonzero only, while the remaining kernels no longer
+    contain these terms. The cells are detected from the coefficient
+    values at setup, or given as ``absorption_cells`` and
+    ``source_cells``, which is required for time-dependent sources.
+
+    With ``autotune=True`` the tiling mode spends the first timesteps
+    timing candidate tile sizes and fusion schemes, ``autotune_steps``
+    timesteps each, and then locks in the fastest configuration. The
+    candidates may be given explicitly as ``autotune_candidates``, a list
+    of dicts with the keys ``tile_size`` and ``fusion_scheme``.
+
+    The fastest configuration found by the autotuner is recorded in a
+    tuning database, keyed by the mesh, the discretisation, the number
+    of processes, ``OMP_NUM_THREADS`` and the options that change the
+    loop chain. Later runs of the tiling mode
+    in the same setting start from the recorded configuration, unless
+    ``tuning_db=False`` is passed. Explicitly passed options take
+    precedence over the recorded ones.
     """
 
     # Fusion/tiling-specific constants
-    loop_chain_length = 28
     num_solves = 8
     tile_size = 1000
     extra_halo = 0
 
-    def __init__(self, mesh, *args, **kwargs):
+    def __init__(self, mesh, family, degree, dimension, **kwargs):
         r""" Tiling and loop fusion require increased halos (s-depth),
         which is currently done by explicitly calling
         mesh.init(sdepth)."""
         self.tiling_mode = kwargs.pop("tiling_mode", None)
-        self.num_unroll = 0 if self.tiling_mode is None else 1
+        self.fuse_invmass = kwargs.pop("fuse_invmass", False)
+        self.compact_invmass = kwargs.pop("compact_invmass", False)
+        self.precision = kwargs.pop("precision", "double")
+        if self.precision not in ("double", "mixed"):
+            raise ValueError("Unknown precision. Must be one of: double, mixed")
+        # Storage type of the inverse mass matrices, see /precision/
+        if self.precision == "mixed":
+            self.invmass_dtype, self.invmass_ctype = np.float32, 'float'
+        else:
+            self.invmass_dtype, self.invmass_ctype = np.float64, 'double'
+        self.replay = kwargs.pop("replay", False)
+        if self.replay and self.tiling_mode is not None:
+            raise ValueError("Timestep replay is not supported with fusion or tiling")
+        # Width of the cell batches the inverse mass matrix is applied to
+        self.batch_width = kwargs.pop("batch_width", None)
+        if self.batch_width is True:
+            import coffee.system
+            self.batch_width = coffee.system.isa['dp_reg']
+        if self.batch_width and (self.tiling_mode is not None or self.fuse_invmass):
+            raise ValueError("Cell batching is only supported in solver mode 'parloop'")
+        # Component layout of the local data in the mat-vec kernels
+        self.layout = kwargs.pop("layout", "aos")
+        if self.layout not in ("aos", "soa"):
+            raise ValueError("Unknown layout. Must be one of: aos, soa")
+        if self.layout == "soa" and (self.tiling_mode is not None or self.fuse_invmass
+                                     or self.batch_width or kwargs.get("symmetric_stress")):
+            raise ValueError("The soa layout is only supported in solver mode 'parloop' "
+                             "without batching or symmetric stress")
+        # Restriction of the absorption and source terms to cell subsets
+        self.subsets = kwargs.pop("subsets", False)
+        self.subset_cells = {'absorption': kwargs.pop("absorption_cells", None),
+                             'source': kwargs.pop("source_cells", None)}
+        if self.subsets and self.tiling_mode is not None:
+            raise ValueError("Cell subsets are not supported with fusion or tiling")
+        autotune = kwargs.pop("autotune", False)
+        candidates = kwargs.pop("autotune_candidates", None)
+        steps = kwargs.pop("autotune_steps", 3)
+
+        # Tuned loop chain configuration, which explicit options override
+        tuned = {}
+        self.tuning_key = None
+        tuning_db = kwargs.pop("tuning_db", True)
+        if self.tiling_mode == 'tile' and tuning_db:
+            # Options that change the loop chain a tuned fusion scheme refers to
+            chain = (self.fuse_invmass, self.compact_invmass, self.precision,
+                     kwargs.get("low_memory", False), kwargs.get("symmetric_stress", False),
+                     kwargs.get("flux", "split"), kwargs.get("split_absorption", False))
+            self.tuning_key = cache_key(plex_signature(mesh), family, degree, dimension,
+                                        mesh.comm.size, os.environ.get('OMP_NUM_THREADS', '1'),
+                                        chain)
+            if not autotune:
+                tuned = load_tuning(mesh.comm, self.tuning_key) or {}
+                if tuned:
+                    log("Using tuned loop chain configuration: %s" % tuned)
+
+        self.unroll = kwargs.pop("unroll", tuned.get('unroll', 1))
+        if self.unroll < 1:
+            raise ValueError("The unroll factor must be at least 1, got %d" % self.unroll)
+        self.num_unroll = 0 if self.tiling_mode is None else self.unroll
+        if kwargs.get("split_absorption") and self.num_unroll > 1:
+            # The damping of a step cannot be fused in between unrolled steps
+            raise ValueError("Split absorption is not supported with unrolled fusion or tiling")
+
+        # Loop chain options, see /pyop2.fusion.loop_chain/
+        self.tile_size = kwargs.pop("tile_size", tuned.get('tile_size', self.tile_size))
+        self.extra_halo = kwargs.pop("extra_halo", self.extra_halo)
+        self.partitioning = kwargs.pop("partitioning", tuned.get('partitioning', "chunk"))
+        self.use_glb_maps = kwargs.pop("use_glb_maps", False)
+        self.use_prefetch = kwargs.pop("use_prefetch", False)
+        self.coloring = kwargs.pop("coloring", "default")
+        self.tiling_log = kwargs.pop("log", False)
+        # Aliased buffers introduce write-after-read dependencies
+        self.ignore_war = not kwargs.get("low_memory", False)
+        self.fusion_scheme = kwargs.pop("fusion_scheme", tuned.get('fusion_scheme'))
+        num_solves, self.explicit_scheme = self.resolve_scheme(self.fusion_scheme)
+        self.chain_name = "main1"
+        self.cache_size = kwargs.pop("cache_size", None)
+        # Fusion schemes derived from the loop chain, see /derive_schemes/
+        self.schemes = []
+        self.chain = []
+
+        # Online autotuning of the loop chain configuration, which
+        # starts once the loop chain is known
+        self.autotuner = None
+        self.autotune = None
+        if autotune:
+            if self.tiling_mode != 'tile' or self.unroll != 1:
+                raise ValueError("Autotuning requires solver mode 'tiling' without unrolling")
+            self.autotune = (candidates, steps)
+            # The halo has to be deep enough for all candidates
+            if candidates:
+                num_solves = max(self.resolve_scheme(c.get('fusion_scheme'))[0]
+                                 for c in candidates)
+            else:
+                num_solves = self.num_solves
+        self.halo_solves = num_solves
+
         if self.tiling_mode is not None:
-            s_depth = self.calculate_sdepth(self.num_solves,
+            s_depth = self.calculate_sdepth(num_solves,
                                             self.num_unroll,
                                             self.extra_halo)
-            mesh.topology.init(s_depth=s_depth)
+            init_kwargs = {'s_depth': s_depth}
+            if self.tiling_mode == 'tile' and self.partitioning == 'metis':
+                init_kwargs['reorder'] = ('metis-rcm', mesh.num_cells() // self.tile_size)
+            mesh.topology.init(**init_kwargs)
         if self.tiling_mode == 'tile':
-            slope(mesh, debug=True)
-        super(TilingElasticLF4, self).__init__(mesh, *args, **kwargs)
+            # SLOPE only needs the coordinates to visualise the tiles
+            slope(mesh, debug=self.tiling_log)
+        super(TilingElasticLF4, self).__init__(mesh, family, degree, dimension, **kwargs)
+
+        # Wall time spent inspecting loop chains
+        self.inspection_time = 0.0
+
+        # Recorded parloops of a timestep for either time level parity
+        self.plans = {}
+        self.parity = 0
+        # Wall times of recorded and replayed timesteps
+        self.step_times = {'record': [], 'replay': [], 'issue': []}
 
         # AST cache
         self.asts = {}
+        # Wrapped RHS assembly kernel cache
+        self.fused_kernels = {}
+        # Batch iteration sets, maps and inverse mass matrices per space
+        self.batches = {}
+        # Cell subsets on which the absorption and source terms are nonzero
+        self.cell_subsets = {}
+
+    def resolve_scheme(self, fusion_scheme):
+        r""" Translate a fusion scheme into the number of solves per
+        fused loop chain and the explicit schedule for the loop chain.
+        :param fusion_scheme: None, 'auto' or an explicit
+            ``(num_solves, schedule)`` tuple. The schedule of 'auto'
+            is only known once the loop chain has been derived. The
+            integer ids of the fusion schemes of ``tests/tiling`` are
+            rejected, since their loop indices only fit the loop chain
+            of that tiling driver.
+        :returns: A tuple (num_solves, schedule)."""
+        if fusion_scheme is None or fusion_scheme == 'auto':
+            return self.num_solves, None
+        if isinstance(fusion_scheme, int):
+            raise ValueError("Fusion scheme ids only fit the loop chain of the tiling driver, "
+                             "use an explicit schedule or 'auto'")
+        return fusion_scheme
+
+    def tuning_candidates(self):
+        r""" The default candidate configurations of the autotuner,
+        which combine tile sizes around the requested one with all
+        fusion schemes derived from the loop chain.
+        :returns: A list of dicts of loop chain options."""
+        tile_sizes = (self.tile_size // 2, self.tile_size, self.tile_size * 2)
+        return [{'tile_size': tile_size, 'fusion_scheme': self.scale_scheme(scheme, tile_size)}
+                for tile_size in tile_sizes for scheme in [None] + self.schemes]
+
+    def scale_scheme(self, scheme, tile_size):
+        r""" Turn a derived fusion scheme, whose schedule holds tile
+        size multipliers, into an explicit scheme for a base tile size.
+        :param scheme: A ``(num_solves, schedule)`` tuple, or None.
+        :param int tile_size: The base tile size.
+        :returns: The explicit fusion scheme."""
+        if scheme is None:
+            return None
+        num_solves, schedule = scheme
+        return num_solves, [(i, j, tile_size*k) for i, j, k in schedule]
+
+    def inspect_chain(self):
+        r""" Capture the parloops of a single timestep, which are
+        removed from the trace again without being executed.
+        :returns: The list of parloops."""
+        n = len(_trace._trace)
+        with self.record() as loops:
+            self.solve_stages()
+        del _trace._trace[n:]
+        return loops
+
+    def derive_schemes(self):
+        r""" Derive fusion schemes from the data dependencies of the
+        loop chain of a timestep, for any forms, degree and dimension,
+        and rank them by the estimated memory traffic, discarding those
+        whose tiles do not fit into ``cache_size`` bytes.
+        :returns: A list of ``(num_solves, schedule)`` tuples, where the
+            schedule holds tile size multipliers."""
+        self.chain = self.inspect_chain()
+        schemes = derive_schemes(self.chain, self.halo_solves)
+        schemes = rank_schemes(self.chain, schemes, self.tile_size, self.dimension, self.cache_size)
+        log("Derived %d fusion schemes for a loop chain of %d loops" % (len(schemes), len(self.chain)))
+        return schemes
+
+    def predict_footprint(self, tile_size=None, num_solves=None):
+        r""" Predict the working set of a tile, in bytes, without running
+        anything. The data accessed by any ``num_solves`` consecutive
+        stages of a timestep is predicted by :meth:`stage_accesses`, and
+        counted as for a captured loop chain (see
+        :func:`seigen.tiling.tile_footprint`), where each fused stage
+        extends the tile by a layer of cells.
+        :param int tile_size: The number of cells per tile, which
+            defaults to the current tile size.
+        :param int num_solves: The number of stages fused into a tile,
+            which defaults to a full timestep.
+        :returns: The largest predicted working set of a tile."""
+        tile_size = tile_size or self.tile_size
+        num_solves = min(num_solves or self.num_solves, len(self.stages))
+        footprint = max(working_set(*self.stage_accesses(self.stages[i:i + num_solves]))
+                        for i in range(len(self.stages) - num_solves + 1))
+        return tile_cells(tile_size, num_solves, self.dimension) * footprint
+
+    def stage_accesses(self, stages):
+        r""" Predict the datasets and maps accessed by the loops of a
+        sequence of LF4 stages, from their forms, the function spaces
+        and the storage of the inverse mass matrices. Fields sharing a
+        buffer in low-memory mode are counted once.
+        :param stages: A sequence of entries of :attr:`stages`.
+        :returns: The datasets and maps, in the format of
+            :func:`seigen.tiling.loop_accesses`."""
+        datasets = {}
+        maps = {}
+        itemsize = np.dtype(self.invmass_dtype).itemsize
+        facet_dat = self.mesh.interior_facets.local_facet_dat
+
+        def access(key, functionspace, nbytes, facets):
+            cell_map = functionspace.cell_node_map()
+            datasets[key] = (cell_map.arity, nbytes)
+            maps[id(cell_map)] = cell_map.arity
+            if facets:
+                facet_map = functionspace.interior_facet_node_map()
+                maps[id(facet_map)] = facet_map.arity
+
+        for result, space, _ in stages:
+            form = getattr(self, "form_" + result)
+            fs = getattr(self, space)
+            facets = any(integral.integral_type() == "interior_facet" for integral in form.integrals())
+            if facets:
+                datasets[id(facet_dat)] = (1, facet_dat.cdim * facet_dat.dtype.itemsize)
+            # The coefficients of the form include the fields read by the stage
+            functions = [self.mesh.coordinates, getattr(self, result)]
+            functions += [c for c in form.coefficients() if isinstance(c, Function)]
+            for f in functions:
+                access(id(f.dat), f.function_space(), f.dat.cdim * f.dat.dtype.itemsize, facets)
+            if not self.fuse_invmass:
+                # The RHS buffer of the stage, shared per space in low-memory mode
+                key = ("RHS", space if self.low_memory else result)
+                access(key, fs, fs.dof_dset.cdim * 8, facets)
+
+            nodes = fs.cell_node_map().arity
+            if self.layout == "soa":
+                # A single scalar inverse mass matrix for all components
+                datasets["invmass"] = (1, nodes * nodes * itemsize)
+            elif self.compact_invmass:
+                # The reference block is a Global, scaled by a DG0 field
+                scaling = FunctionSpace(self.mesh, "DG", 0)
+                access(("invmass", space), scaling, 8, False)
+            else:
+                n = nodes * fs.dof_dset.cdim
+                datasets[("invmass", space)] = (1, n * n * itemsize)
+        return datasets, maps
+
+    def candidate_footprint(self, tile_size, fusion_scheme=None):
+        r""" Estimate the largest working set of a tile, in bytes, for a
+        loop chain configuration, using the loop chain captured by
+        :meth:`derive_schemes`.
+        :param int tile_size: The base tile size.
+        :param fusion_scheme: The fusion scheme, see :meth:`resolve_scheme`.
+        :returns: The largest working set of a tile of any fused region."""
+        schedule = self.resolve_scheme(fusion_scheme)[1]
+        if schedule is None:
+            return tile_footprint(self.chain, tile_size, self.dimension)
+        return max(tile_footprint(self.chain[i:j + 1], k, self.dimension) for i, j, k in schedule)
+
+    def configure(self, tile_size, fusion_scheme=None, name="main1"):
+        r""" Change the configuration of subsequent loop chains.
+        :param int tile_size: The base tile size.
+        :param fusion_scheme: The fusion scheme, see :meth:`resolve_scheme`.
+        :param str name: The name of the loop chain, which identifies
+            its inspection.
+        :returns: None"""
+        self.tile_size = tile_size
+        self.fusion_scheme = fusion_scheme
+        self.explicit_scheme = self.resolve_scheme(fusion_scheme)[1]
+        self.chain_name = name
+
+    def tune_timestep(self, t):
+        r""" Advance the solution fields by a single timestep using the
+        current candidate configuration of the autotuner, and lock in
+        the fastest configuration once all candidates have been timed.
+        :param float t: The time at the end of the timestep.
+        :returns: None"""
+        tuner = self.autotuner
+        index = tuner.current
+        self.configure(name="main1_tune%d" % index, **tuner.candidates[index])
+
+        _trace.evaluate_all()
+        start = time.time()
+        with timed_region('autotuning'):
+            super(TilingElasticLF4, self).timestep(t)
+            _trace.evaluate_all()
+        tuner.record(time.time() - start)
+
+        if not tuner.tuning:
+            best = tuner.candidates[tuner.best]
+            self.configure(name="main1_tune%d" % tuner.best, **best)
+            log("Autotuner selected tile_size=%d, fusion_scheme=%s (%.3f ms per timestep)"
+                % (self.tile_size, self.fusion_scheme, 1000.0 * tuner.mean[tuner.best]))
+            if self.tuning_key is not None:
+                store_tuning(self.mesh.comm, self.tuning_key,
+                             {'tile_size': self.tile_size, 'fusion_scheme': self.fusion_scheme,
+                              'unroll': self.unroll, 'partitioning': self.partitioning,
+                              'time': tuner.mean[tuner.best]})
 
     def calculate_sdepth(self, num_solves, num_unroll, extra_halo):
         r""" The sdepth for large halo regions is calculated as:
@@ -435,38 +1215,283 @@ class TilingElasticLF4(ExplicitElasticLF4):
         else:
             return 1
 
-    def matrix_to_dat(self, massmatrix, functionspace):
-        r""" Copy the clock diagonal entries of the velocity mass
-        matrix into a pyop2.Dat"""
-        arity = sum(functionspace.topological.dofs_per_entity)*functionspace.topological.dim
-        dat = Dat(DataSet(self.mesh.cell_set, arity*arity), dtype='double')
+    def matrix_to_dat(self, massmatrix, functionspace, invert=False):
+        r""" Copy the block diagonal entries of a (DG) mass matrix into
+        a pyop2.Dat, with one dense block per cell. The blocks are
+        extracted from the CSR representation of the matrix in a single
+        sweep, and optionally inverted as a batch.
+
+        :param massmatrix: The assembled block-diagonal mass matrix.
+        :param functionspace: The function space of the mass matrix.
+        :param bool invert: If True, store the inverse of each block.
+        :returns: A pyop2.Dat holding ``arity*arity`` values per cell."""
+        arity = sum(functionspace.topological.dofs_per_entity)*functionspace.dof_dset.cdim
+        dat = Dat(DataSet(self.mesh.cell_set, arity*arity), dtype=self.invmass_dtype)
         istart, iend = massmatrix.handle.getOwnershipRange()
-        idxs = [PETSc.IS().createGeneral(np.arange(i, i+arity, dtype=np.int32),
-                                         comm=PETSc.COMM_SELF)
-                for i in range(istart, iend, arity)]
-        submats = massmatrix.handle.getSubMatrices(idxs, idxs)
-        for i, m in enumerate(submats):
-            dat.data[i] = m[:, :].flatten()
+        _, _, values = massmatrix.handle.getValuesCSR()
+        if values.size != (iend - istart)*arity:
+            raise ValueError("Mass matrix is not block-diagonal with blocks of size %d" % arity)
+        blocks = values.reshape(-1, arity, arity)
+        if invert:
+            blocks = np.linalg.inv(blocks)
+        dat.data[:] = blocks.reshape(-1, arity*arity)
         return dat
 
+    def matrix_to_compact(self, massmatrix, functionspace):
+        r""" Convert a block-diagonal (DG) mass matrix into the compact
+        form of its inverse, i.e. one reference block plus one scalar
+        per cell. This is only valid if each local block is the same
+        reference block scaled by the cell volume, which holds on affine
+        simplex meshes; otherwise dense inverse blocks are returned.
+
+        :param massmatrix: The assembled block-diagonal mass matrix.
+        :param functionspace: The function space of the mass matrix.
+        :returns: An :class:`AffineInverseMass`, or a pyop2.Dat as in
+            :meth:`matrix_to_dat` if the blocks are not scaled copies."""
+        coordinates = self.mesh.coordinates.function_space().ufl_element()
+        if not (self.mesh.ufl_cell().is_simplex() and coordinates.degree() == 1):
+            log("Mesh is not affine, using dense inverse mass blocks")
+            return self.matrix_to_dat(massmatrix, functionspace, invert=True)
+
+        arity = sum(functionspace.topological.dofs_per_entity)*functionspace.dof_dset.cdim
+        istart, iend = massmatrix.handle.getOwnershipRange()
+        _, _, values = massmatrix.handle.getValuesCSR()
+        if values.size != (iend - istart)*arity:
+            raise ValueError("Mass matrix is not block-diagonal with blocks of size %d" % arity)
+        blocks = values.reshape(-1, arity, arity)
+
+        # Cell volumes, ordered as the cells of the mesh
+        P0 = FunctionSpace(self.mesh, "DG", 0)
+        volumes = assemble(TestFunction(P0)*dx)
+        cells = P0.cell_node_map().values[:len(blocks), 0]
+        cell_volumes = volumes.dat.data_ro[cells]
+
+        # All ranks share the reference block of the first rank owning
+        # cells, and take the decision between compact and dense blocks
+        # together, so that they all build the same parloops
+        comm = self.mesh.comm
+        root = comm.allreduce(comm.rank if len(blocks) else comm.size, op=mpi4py.MPI.MIN)
+        if root == comm.size:
+            return self.matrix_to_dat(massmatrix, functionspace, invert=True)
+        reference = comm.bcast(blocks[0] / cell_volumes[0] if comm.rank == root else None, root=root)
+        # Mass matrix entries scale with the cell volume, so compare
+        # each block relative to its own magnitude
+        scaled = True
+        if len(blocks):
+            error = np.abs(blocks - cell_volumes[:, None, None]*reference).reshape(len(blocks), -1)
+            scale = np.abs(blocks).reshape(len(blocks), -1)
+            scaled = bool(np.all(error.max(axis=1) <= 1e-10*scale.max(axis=1)))
+        if not comm.allreduce(scaled, op=mpi4py.MPI.LAND):
+            log("Local mass matrices are not scaled copies, using dense inverse mass blocks")
+            return self.matrix_to_dat(massmatrix, functionspace, invert=True)
+
+        scaling = Function(P0)
+        scaling.dat.data[:] = 1.0 / volumes.dat.data_ro
+        reference = Global(arity*arity, np.linalg.inv(reference).flatten(), dtype=self.invmass_dtype)
+        return AffineInverseMass(reference, scaling)
+
+    def mass_to_dat(self, massmatrix, functionspace):
+        r""" Convert a mass matrix into the inverse mass representation
+        used by the PyOP2 kernels, compact or dense."""
+        if self.compact_invmass:
+            return self.matrix_to_compact(massmatrix, functionspace)
+        return self.matrix_to_dat(massmatrix, functionspace, invert=True)
+
     def setup(self, *args, **kwargs):
-        r""" After creating inverse mass matrices we extract diagonal
-        block entries into a pyop2.Dat."""
-        super(TilingElasticLF4, self).setup(*args, **kwargs)
-        # Convert inverse mass matrices to PyOP2 Dats
-        self.invmass_velocity = self.matrix_to_dat(self.invmass_velocity, self.U)
-        self.invmass_stress = self.matrix_to_dat(self.invmass_stress, self.S)
-
-    def ast_matmul(self, F_a):
+        r""" Compute the inverse mass matrices directly as cell-wise
+        blocks in a pyop2.Dat, by inverting the local blocks of the
+        (consistent) mass matrices."""
+        log("Generating inverse mass matrices")
+        if self.layout == "soa":
+            # The mass matrices of all components are identical scalar ones
+            V = FunctionSpace(self.mesh, self.family, self.degree, name='V')
+            self.invmass_velocity = self.assemble_inverse_mass(
+                inner(TestFunction(V), TrialFunction(V))*dx, V)
+            self.invmass_stress = self.invmass_velocity
+        else:
+            self.invmass_velocity = self.assemble_inverse_mass(inner(self.w, self.u)*dx, self.U)
+            self.invmass_stress = self.assemble_inverse_mass(inner(self.v, self.s)*dx, self.S)
+
+        # Setup RHS assembly objects
+        super(ExplicitElasticLF4, self).setup(*args, **kwargs)
+
+        if self.batch_width:
+            self.batches[self.U.name] = self.batch_args(self.U, self.invmass_velocity)
+            self.batches[self.S.name] = self.batch_args(self.S, self.invmass_stress)
+            log("Applying inverse mass matrices to batches of %d cells" % self.batch_width)
+        if self.tiling_mode is not None and (self.fusion_scheme == 'auto' or self.autotune):
+            self.schemes = self.derive_schemes()
+        if self.fusion_scheme == 'auto':
+            scheme = self.scale_scheme(self.schemes[0], self.tile_size) if self.schemes else None
+            self.configure(self.tile_size, scheme)
+            log("Using fusion scheme: %s" % (scheme,))
+        if self.autotune:
+            candidates, steps = self.autotune
+            candidates = candidates or self.tuning_candidates()
+            if self.cache_size is not None:
+                # Reject configurations whose tiles overflow the cache
+                fitting = [c for c in candidates
+                           if self.candidate_footprint(**c) <= self.cache_size]
+                log("Rejected %d of %d autotuning candidates exceeding %d KB per tile"
+                    % (len(candidates) - len(fitting), len(candidates), self.cache_size // 1024))
+                candidates = fitting or candidates
+            self.autotuner = Autotuner(candidates, steps, self.mesh.comm)
+
+    def assemble_inverse_mass(self, form, functionspace):
+        r""" Compute the cell-wise inverse of a mass matrix, or load it
+        from the on-disk cache if enabled.
+        :param ufl.Form form: The bilinear mass form.
+        :param functionspace: The function space of the mass matrix.
+        :returns: The inverse mass matrix, dense or compact."""
+        comm = self.mesh.comm
+        if self.cache_invmass:
+            # The blocks are stored in the precision they are used in
+            key = self.invmass_key(functionspace, self.compact_invmass, self.precision)
+            arrays = load_arrays(comm, key)
+            if arrays is not None:
+                log("Loaded inverse mass matrix for %s from cache" % functionspace.name)
+                return self.arrays_to_dat(arrays, functionspace)
+        mass = assemble(form)
+        mass.assemble()
+        matrix = self.mass_to_dat(mass.M, functionspace)
+        if self.cache_invmass:
+            if isinstance(matrix, AffineInverseMass):
+                store_arrays(comm, key, reference=matrix.reference.data_ro,
+                             scaling=matrix.scaling.dat.data_ro)
+            else:
+                store_arrays(comm, key, blocks=matrix.data_ro)
+        return matrix
+
+    def arrays_to_dat(self, arrays, functionspace):
+        r""" Rebuild an inverse mass matrix from cached arrays. """
+        if 'blocks' in arrays:
+            blocks = arrays['blocks']
+            dat = Dat(DataSet(self.mesh.cell_set, blocks.shape[1]), dtype=self.invmass_dtype)
+            dat.data[:] = blocks
+            return dat
+        reference = arrays['reference']
+        scaling = Function(FunctionSpace(self.mesh, "DG", 0))
+        scaling.dat.data[:] = arrays['scaling']
+        return AffineInverseMass(Global(reference.size, reference, dtype=self.invmass_dtype), scaling)
+
+    def invmass_args(self, matrix, integral_type='cell'):
+        r""" Build the PyOP2 arguments that pass an inverse mass matrix
+        to a kernel iterating over cells or facets.
+        :param matrix: The inverse mass matrix, dense or compact.
+        :param str integral_type: The iteration set of the kernel.
+        :returns: A list of pyop2 arguments."""
+        mesh = self.mesh
+        if isinstance(matrix, AffineInverseMass):
+            scaling = matrix.scaling
+            if integral_type == 'cell':
+                scaling_map = scaling.cell_node_map()
+            elif integral_type == 'exterior_facet':
+                scaling_map = scaling.exterior_facet_node_map()
+            else:
+                scaling_map = scaling.interior_facet_node_map()
+            return [matrix.reference(op2.READ), scaling.dat(op2.READ, scaling_map)]
+        if integral_type == 'cell':
+            return [matrix(op2.READ)]
+        elif integral_type == 'exterior_facet':
+            return [matrix(op2.READ, mesh.exterior_facets.facet_cell_map)]
+        else:
+            return [matrix(op2.READ, mesh.interior_facets.facet_cell_map)]
+
+    def batch_args(self, functionspace, matrix):
+        r""" Build the iteration set and maps to apply an inverse mass
+        matrix to batches of ``batch_width`` cells at a time, along with
+        the inverse mass matrix arguments in a batch-interleaved layout,
+        such that the kernel may vectorise across the cells of a batch.
+        The last batch is padded by repeating the last cell.
+        :param functionspace: The function space of the solution field.
+        :param matrix: The inverse mass matrix, dense or compact.
+        :returns: A tuple (batch set, batch map, inverse mass arguments)."""
+        W = self.batch_width
+        cells = self.mesh.cell_set.size
+        nbatches = (cells + W - 1) // W
+        index = np.minimum(np.arange(nbatches*W), cells - 1).reshape(nbatches, W)
+        batch_set = op2.Set(nbatches, comm=self.mesh.comm)
+
+        def batch_map(fs):
+            values = fs.cell_node_map().values[index].reshape(nbatches, -1)
+            return op2.Map(batch_set, fs.node_set, values.shape[1], values)
+
+        if isinstance(matrix, AffineInverseMass):
+            scaling = matrix.scaling
+            args = [matrix.reference(op2.READ),
+                    scaling.dat(op2.READ, batch_map(scaling.function_space()))]
+        else:
+            # Interleave the blocks, so that the entries of all cells
+            # of a batch are contiguous
+            blocks = matrix.data_ro[index]
+            dat = Dat(DataSet(batch_set, W*matrix.cdim), dtype=self.invmass_dtype)
+            dat.data[:] = blocks.transpose(0, 2, 1).reshape(nbatches, -1)
+            args = [dat(op2.READ)]
+        return batch_set, batch_map(functionspace), args
+
+    def ast_matmul_batched(self, F_a, compact=False):
+        """Generate an AST for a PyOP2 kernel performing matrix-vector
+        multiplications for a batch of cells, vectorised across cells.
+
+        :param F_a: Assembled firedrake.Function object for the RHS
+        :param bool compact: If True, the matrix is a reference block
+            ``A`` scaled by a per-cell scalar ``D``"""
+        F_a_fs = F_a.function_space()
+        ndofs = sum(F_a_fs.topological.dofs_per_entity)
+        cdim = F_a_fs.dof_dset.cdim
+        W = self.batch_width
+        n = ndofs*cdim
+        name = 'mat_vec_mul_kernel_%s_batch%d' % (F_a_fs.name, W)
+        if compact:
+            name += '_compact'
+        name += '_%s' % self.invmass_ctype
+
+        identifier = (ndofs, cdim, name)
+        if identifier in self.asts:
+            return self.asts[identifier]
+
+        # Craft the AST, with the loop over the cells of a batch innermost
+        if compact:
+            A = ast.Symbol('A', ('i*%d + j*%d + k' % (n, cdim),))
+            result = ast.Prod(ast.Symbol('D', ('w', 0)), ast.Symbol('c', ('w',)))
+        else:
+            A = ast.Symbol('A', ('(i*%d + j*%d + k)*%d + w' % (n, cdim, W),))
+            result = ast.Symbol('c', ('w',))
+        body = ast.Incr(ast.Symbol('c', ('w',)),
+                        ast.Prod(A, ast.Symbol('B', ('w*%d + j' % ndofs, 'k'))))
+        body = ast.c_for('w', W, body).children[0]
+        body = ast.c_for('k', cdim, body).children[0]
+        body = ast.c_for('j', ndofs, body).children[0]
+        store = ast.Assign(ast.Symbol('C', ('w*%d + i/%d' % (ndofs, cdim), 'i%%%d' % cdim)), result)
+        body = ast.Block([ast.FlatBlock('double c[%d] = {0.0};\n' % W), body,
+                          ast.c_for('w', W, store).children[0]])
+        body = ast.Root([ast.c_for('i', n, body).children[0]])
+        funargs = [ast.Decl('%s*' % self.invmass_ctype, 'A'),
+                   ast.Decl('double**', 'B'), ast.Decl('double**', 'C')]
+        if compact:
+            funargs.insert(1, ast.Decl('double**', 'D'))
+        fundecl = ast.FunDecl('void', name, funargs, body, ['static', 'inline'])
+
+        self.asts[identifier] = fundecl
+        return fundecl
+
+    def ast_matmul(self, F_a, compact=False):
         """Generate an AST for a PyOP2 kernel performing a matrix-vector multiplication.
 
-        :param F_a: Assembled firedrake.Function object for the RHS"""
+        :param F_a: Assembled firedrake.Function object for the RHS
+        :param bool compact: If True, the matrix is a reference block
+            ``A`` scaled by a per-cell scalar ``D``"""
 
-        # The number of dofs on each element is /ndofs*cdim/
+        # The number of dofs on each element is /ndofs*cdim/, where cdim
+        # is the number of stored components (fewer than the value size
+        # for symmetric tensors)
         F_a_fs = F_a.function_space()
         ndofs = sum(F_a_fs.topological.dofs_per_entity)
-        cdim = F_a_fs.dim
+        cdim = F_a_fs.dof_dset.cdim
         name = 'mat_vec_mul_kernel_%s' % F_a_fs.name
+        if compact:
+            name += '_compact'
+        name += '_%s' % self.invmass_ctype
 
         identifier = (ndofs, cdim, name)
         if identifier in self.asts:
@@ -479,8 +1504,15 @@ class TilingElasticLF4(ExplicitElasticLF4):
         body = ast.c_for('k', cdim, body).children[0]
         body = [ast.Assign(ast.Symbol('C', ('i/%d' % cdim, 'i%%%d' % cdim)), '0.0'),
                 ast.c_for('j', ndofs, body).children[0]]
+        if compact:
+            body.append(ast.Assign(ast.Symbol('C', ('i/%d' % cdim, 'i%%%d' % cdim)),
+                                   ast.Prod(ast.Symbol('D', (0, 0)),
+                                            ast.Symbol('C', ('i/%d' % cdim, 'i%%%d' % cdim)))))
         body = ast.Root([ast.c_for('i', ndofs*cdim, body).children[0]])
-        funargs = [ast.Decl('double*', 'A'), ast.Decl('double**', 'B'), ast.Decl('double**', 'C')]
+        funargs = [ast.Decl('%s*' % self.invmass_ctype, 'A'),
+                   ast.Decl('double**', 'B'), ast.Decl('double**', 'C')]
+        if compact:
+            funargs.insert(1, ast.Decl('double**', 'D'))
         fundecl = ast.FunDecl('void', name, funargs, body, ['static', 'inline'])
 
         # Track the AST for later fast retrieval
@@ -488,20 +1520,356 @@ class TilingElasticLF4(ExplicitElasticLF4):
 
         return fundecl
 
-    def solve(self, rhs, matrix, result):
+    def create_solver(self, form, result, name):
+        r""" Solution context for the PyOP2-level modes is the RHS form
+        along with a buffer for the assembled RHS or, in the fused mode,
+        its compiled local assembly kernels, as well as the terms of the
+        RHS that are restricted to cell subsets. In low-memory mode the
+        stages on the same function space share the RHS buffer. The
+        kernels of each stage are named after the stage, so that kernels
+        of different forms never share a name."""
+        L = rhs(form)
+        terms = []
+        if self.subsets:
+            L, terms = self.split_subsets(L, name)
+        if not self.fuse_invmass:
+            if self.low_memory:
+                # Write-after-read dependencies between stages are honoured
+                return L, self.rhs_buffer(result.function_space()), terms
+            return L, self.allocate(result.function_space(), name="RHS"), terms
+        return L, tsfc.compile_form(L, prefix="rhs_%s" % name), terms
+
+    def split_subsets(self, L, stage):
+        r""" Split the absorption and source terms off a RHS form. These
+        terms are linear in their coefficients, which are only nonzero on
+        small subsets of cells (the sponge layer and the source region).
+        :param ufl.Form L: The RHS form.
+        :param str stage: The name of the stage the form belongs to.
+        :returns: The RHS form without these terms, along with a list of
+            (compiled kernels, form, cell subset) tuples for the terms."""
+        terms = []
+        for name, coefficient in (('absorption', self.absorption), ('source', self.source)):
+            if coefficient is None or coefficient not in L.coefficients():
+                continue
+            # The term is the derivative of the form in the direction of its coefficient
+            term = ufl.derivative(L, coefficient, coefficient)
+            L = ufl.replace(L, {coefficient: ufl.classes.Zero(coefficient.ufl_shape)})
+            terms.append((tsfc.compile_form(term, prefix="rhs_%s_%s" % (stage, name)), term,
+                          self.cell_subset(name, coefficient)))
+        return L, terms
+
+    def cell_subset(self, name, function):
+        r""" The subset of owned cells on which a coefficient is nonzero,
+        unless given explicitly via the ``absorption_cells`` or
+        ``source_cells`` options. Time-dependent sources must be given
+        explicitly, and a coefficient that vanishes everywhere is an
+        error, as the term would silently be dropped.
+        :param str name: The name of the term, 'absorption' or 'source'.
+        :param firedrake.Function function: The coefficient of the term.
+        :returns: A pyop2.Subset of the cell set."""
+        if name in self.cell_subsets:
+            return self.cell_subsets[name]
+        cells = self.subset_cells[name]
+        if cells is None:
+            if name == 'source' and self.source_expression is not None:
+                # The values at setup may vanish where the source does not
+                raise ValueError("Time-dependent sources require source_cells with subsets=True")
+            values = function.dat.data_ro_with_halos
+            nonzero = np.abs(values.reshape(values.shape[0], -1)).max(axis=1) > 0
+            cell_nodes = function.cell_node_map().values[:self.mesh.cell_set.size]
+            cells = np.flatnonzero(nonzero[cell_nodes].any(axis=1))
+            if not self.mesh.comm.allreduce(len(cells), op=mpi4py.MPI.SUM):
+                raise ValueError("The %s coefficient vanishes on all cells, pass %s_cells "
+                                 "to define the support of the %s term" % (name, name, name))
+        log("Restricting the %s term to %d of %d cells" % (name, len(cells), self.mesh.cell_set.size))
+        self.cell_subsets[name] = op2.Subset(self.mesh.cell_set, np.asarray(cells, dtype=np.int32))
+        return self.cell_subsets[name]
+
+    def ast_fused(self, kernel, ndofs, cdim, compact=False, invmass=True):
+        """Generate an AST for a PyOP2 kernel wrapping a local RHS
+        assembly kernel, such that the local contribution is multiplied
+        by the cell-local inverse mass matrix before being incremented
+        into the solution field.
+
+        :param kernel: The TSFC kernel of a single RHS integral.
+        :param int ndofs: Number of nodes per cell.
+        :param int cdim: Number of components per node.
+        :param bool compact: If True, the inverse mass matrix is a
+            reference block ``A`` scaled by a per-cell scalar ``D``.
+        :param bool invmass: If False, the local contribution is
+            incremented into an RHS buffer as it is, without applying
+            the inverse mass matrix."""
+        tsfc_decl = kernel.ast
+        if invmass:
+            name = 'fused_%s%s_%s' % (tsfc_decl.name, '_compact' if compact else '', self.invmass_ctype)
+        else:
+            name = 'scatter_%s' % tsfc_decl.name
+        if name in self.fused_kernels:
+            return self.fused_kernels[name]
+
+        n = ndofs*cdim
+        sides = 2 if kernel.integral_type == 'interior_facet' else 1
+        ctype = self.invmass_ctype
+        if not invmass:
+            M_decls = []
+        elif compact:
+            M = 'D[s][0]*A[i*%d + j]' % n
+            M_decls = [ast.Decl('%s *' % ctype, 'A'), ast.Decl('double **', 'D')]
+        elif kernel.integral_type == 'cell':
+            M, M_decls = 'M[i*%d + j]' % n, [ast.Decl('%s *' % ctype, 'M')]
+        else:
+            M, M_decls = 'M[s][i*%d + j]' % n, [ast.Decl('%s **' % ctype, 'M')]
+
+        # The local contribution T is computed by the original kernel,
+        # multiplied by the local inverse mass matrix (if any) and added
+        # into C.
+        # The inverse mass blocks and C are node-interleaved, while T is
+        # ordered component by component over the nodes of all sides.
+        args = ', '.join(a.sym.symbol for a in tsfc_decl.args[1:])
+        call = '%s((void *)T, %s);' % (tsfc_decl.name, args)
+        C = ast.Symbol('C', ('s*%d + i/%d' % (ndofs, cdim), 'i%%%d' % cdim))
+        if invmass:
+            T = 'T[(j%%%d)*%d + s*%d + j/%d]' % (cdim, sides*ndofs, ndofs, cdim)
+            body = ast.Incr(C, ast.Prod(ast.Symbol(M), ast.Symbol(T)))
+            body = ast.c_for('j', n, body).children[0]
+        else:
+            T = 'T[(i%%%d)*%d + s*%d + i/%d]' % (cdim, sides*ndofs, ndofs, cdim)
+            body = ast.Incr(C, ast.Symbol(T))
+        body = ast.c_for('i', n, body).children[0]
+        body = ast.Block([ast.FlatBlock('double T[%d] = {0.0};\n' % (sides*n)),
+                          ast.FlatBlock(call + '\n'),
+                          ast.c_for('s', sides, body).children[0]])
+        funargs = [ast.Decl('double **', 'C')] + tsfc_decl.args[1:] + M_decls
+        fundecl = ast.FunDecl('void', name, funargs, body, ['static', 'inline'])
+        kernel = op2.Kernel(ast.Root([tsfc_decl, fundecl]).gencode(), name)
+
+        self.fused_kernels[name] = kernel
+        return kernel
+
+    def solve_fused(self, ctx, matrix, result):
+        r""" Solve by assembling the RHS with kernels that apply the
+        local inverse mass matrix, directly incrementing the solution.
+        :param ctx: The RHS form and its compiled TSFC kernels.
+        :param matrix: The inverse mass matrix, dense or compact.
+        :param firedrake.Function result: The solution field.
+        :returns: None"""
+        L, kernels, terms = ctx
+        fs = result.function_space()
+        ndofs = sum(fs.topological.dofs_per_entity)
+        cdim = fs.dof_dset.cdim
+        compact = isinstance(matrix, AffineInverseMass)
+
+        result.dat.zero()
+        for kernel in kernels:
+            itspace, args = self.kernel_args(kernel, L.coefficients(), result)
+            args.extend(self.invmass_args(matrix, kernel.integral_type))
+            op2.par_loop(self.ast_fused(kernel, ndofs, cdim, compact), itspace, *args)
+        for kernels, term, subset in terms:
+            for kernel in kernels:
+                _, args = self.kernel_args(kernel, term.coefficients(), result)
+                args.extend(self.invmass_args(matrix))
+                op2.par_loop(self.ast_fused(kernel, ndofs, cdim, compact), subset, *args)
+
+    def kernel_args(self, kernel, coefficients, tensor):
+        r""" Build the iteration set and the arguments of a parloop that
+        executes a local assembly kernel, in the order of the kernel
+        signature, incrementing the assembled values into a tensor.
+        :param kernel: The TSFC kernel of a single RHS integral.
+        :param coefficients: The coefficients of the compiled form.
+        :param firedrake.Function tensor: The assembled RHS.
+        :returns: A tuple (iteration set, list of pyop2 arguments)."""
+        mesh = self.mesh
+        if kernel.integral_type == 'cell':
+            itspace = mesh.cell_set
+            get_map = lambda f: f.cell_node_map()
+        elif kernel.integral_type == 'exterior_facet':
+            itspace = mesh.exterior_facets.set
+            get_map = lambda f: f.exterior_facet_node_map()
+        elif kernel.integral_type == 'interior_facet':
+            itspace = mesh.interior_facets.set
+            get_map = lambda f: f.interior_facet_node_map()
+        else:
+            raise ValueError("Unsupported integral type '%s'" % kernel.integral_type)
+
+        # As in firedrake's assemble, the TSFC kernel reads its arguments
+        # flattened, component by component. The tensor is only accessed
+        # by the wrapping kernel, which indexes it per node and component
+        args = [tensor.dat(op2.INC, get_map(tensor)),
+                mesh.coordinates.dat(op2.READ, get_map(mesh.coordinates), flatten=True)]
+        if kernel.oriented:
+            orientations = mesh.cell_orientations()
+            args.append(orientations.dat(op2.READ, get_map(orientations), flatten=True))
+        for n in kernel.coefficient_numbers:
+            for c in coefficients[n].split():
+                args.append(c.dat(op2.READ, get_map(c), flatten=True))
+        if kernel.integral_type == 'exterior_facet':
+            args.append(mesh.exterior_facets.local_facet_dat(op2.READ))
+        elif kernel.integral_type == 'interior_facet':
+            args.append(mesh.interior_facets.local_facet_dat(op2.READ))
+        return itspace, args
+
+    def solve(self, ctx, matrix, result):
         r""" Solve by assembling RHS and applying inverse mass matrix using a PyOP2 Parloop.
-        :param rhs: The RHS vector that the inverse mass matrix will be multiplied with.
+        :param ctx: The RHS form and the buffer it is assembled into.
         :param matrix: The inverse mass matrix.
         :param firedrake.Function result: The solution field.
         :returns: None"""
-        F_a = assemble(rhs)
-        ast_matmul = self.ast_matmul(F_a)
+        if self.fuse_invmass:
+            return self.solve_fused(ctx, matrix, result)
+        rhs, F_a, terms = ctx
+        assemble(rhs, tensor=F_a)
+        fs = F_a.function_space()
+        ndofs = sum(fs.topological.dofs_per_entity)
+        cdim = fs.dof_dset.cdim
+        for kernels, term, subset in terms:
+            for kernel in kernels:
+                _, args = self.kernel_args(kernel, term.coefficients(), F_a)
+                op2.par_loop(self.ast_fused(kernel, ndofs, cdim, invmass=False), subset, *args)
+        if self.batch_width:
+            return self.solve_batched(F_a, matrix, result)
+        if self.layout == "soa":
+            ast_matmul = self.ast_matmul_soa(F_a, isinstance(matrix, AffineInverseMass))
+        else:
+            ast_matmul = self.ast_matmul(F_a, isinstance(matrix, AffineInverseMass))
 
         # Create the par loop (automatically added to the trace of loops to be executed)
         kernel = op2.Kernel(ast_matmul, ast_matmul.name)
-        op2.par_loop(kernel, self.mesh.cell_set, matrix(op2.READ),
-                     F_a.dat(op2.READ, F_a.cell_node_map()),
-                     result.dat(op2.WRITE, result.cell_node_map()))
+        args = self.invmass_args(matrix) + [F_a.dat(op2.READ, F_a.cell_node_map()),
+                                            result.dat(op2.WRITE, result.cell_node_map())]
+        op2.par_loop(kernel, self.mesh.cell_set, *args)
+
+    def ast_matmul_soa(self, F_a, compact=False):
+        """Generate an AST for a PyOP2 kernel applying a scalar inverse
+        mass matrix to each component of a vector or tensor field. The
+        local data is transposed into component-contiguous (SoA) arrays,
+        so that the inner products run over contiguous memory.
+
+        :param F_a: Assembled firedrake.Function object for the RHS
+        :param bool compact: If True, the matrix is a reference block
+            ``A`` scaled by a per-cell scalar ``D``"""
+        F_a_fs = F_a.function_space()
+        ndofs = sum(F_a_fs.topological.dofs_per_entity)
+        cdim = F_a_fs.dof_dset.cdim
+        name = 'mat_vec_mul_kernel_%s_soa' % F_a_fs.name
+        if compact:
+            name += '_compact'
+        name += '_%s' % self.invmass_ctype
+
+        identifier = (ndofs, cdim, name)
+        if identifier in self.asts:
+            return self.asts[identifier]
+
+        # Craft the AST
+        gather = ast.Assign(ast.Symbol('b', ('k', 'j')), ast.Symbol('B', ('j', 'k')))
+        gather = ast.c_for('j', ndofs, ast.c_for('k', cdim, gather).children[0]).children[0]
+        body = ast.Incr(ast.Symbol('c', ('k', 'i')),
+                        ast.Prod(ast.Symbol('A', ('i*%d + j' % ndofs,)), ast.Symbol('b', ('k', 'j'))))
+        body = ast.c_for('j', ndofs, body).children[0]
+        body = ast.c_for('i', ndofs, body).children[0]
+        body = ast.c_for('k', cdim, body).children[0]
+        result = ast.Symbol('c', ('k', 'i'))
+        if compact:
+            result = ast.Prod(ast.Symbol('D', (0, 0)), result)
+        scatter = ast.Assign(ast.Symbol('C', ('i', 'k')), result)
+        scatter = ast.c_for('i', ndofs, ast.c_for('k', cdim, scatter).children[0]).children[0]
+        body = ast.Root([ast.FlatBlock('double b[%d][%d];\n' % (cdim, ndofs)),
+                         ast.FlatBlock('double c[%d][%d] = {{0.0}};\n' % (cdim, ndofs)),
+                         gather, body, scatter])
+        funargs = [ast.Decl('%s*' % self.invmass_ctype, 'A'),
+                   ast.Decl('double**', 'B'), ast.Decl('double**', 'C')]
+        if compact:
+            funargs.insert(1, ast.Decl('double**', 'D'))
+        fundecl = ast.FunDecl('void', name, funargs, body, ['static', 'inline'])
+
+        self.asts[identifier] = fundecl
+        return fundecl
+
+    def solve_batched(self, F_a, matrix, result):
+        r""" Apply the inverse mass matrix to an assembled RHS, iterating
+        over batches of cells.
+        :param F_a: The assembled RHS.
+        :param matrix: The inverse mass matrix.
+        :param firedrake.Function result: The solution field.
+        :returns: None"""
+        batch_set, batch_map, args = self.batches[result.function_space().name]
+        ast_matmul = self.ast_matmul_batched(F_a, isinstance(matrix, AffineInverseMass))
+        kernel = op2.Kernel(ast_matmul, ast_matmul.name)
+        args = args + [F_a.dat(op2.READ, batch_map), result.dat(op2.WRITE, batch_map)]
+        op2.par_loop(kernel, batch_set, *args)
+
+    @contextmanager
+    def record(self):
+        r""" Context manager that records all parloops added to the
+        PyOP2 execution trace, regardless of when they are evaluated.
+        :returns: The list of recorded parloops."""
+        plan = []
+        append = _trace.append
+
+        def record_append(computation):
+            plan.append(computation)
+            append(computation)
+        _trace.append = record_append
+        try:
+            yield plan
+        finally:
+            del _trace.append
+
+    def timestep(self, t):
+        r""" Advance the solution fields by a single timestep, replaying
+        a previously recorded plan if ``replay=True``.
+        :param float t: The time at the end of the timestep.
+        :returns: None"""
+        if self.autotuner is not None and self.autotuner.tuning:
+            return self.tune_timestep(t)
+        if not self.replay:
+            return super(TilingElasticLF4, self).timestep(t)
+
+        # Replayed parloops execute eagerly, after any pending ones
+        _trace.evaluate_all()
+        start = time.time()
+
+        plan = self.plans.get(self.parity)
+        if plan is None:
+            with timed_region('timestep recording'):
+                with self.record() as plan:
+                    self.solve_stages()
+                self.step_times['issue'].append(time.time() - start)
+                _trace.evaluate_all()
+            self.plans[self.parity] = plan
+            self.step_times['record'].append(time.time() - start)
+        else:
+            with timed_region('timestep replay'):
+                for computation in plan:
+                    computation._run()
+            self.step_times['replay'].append(time.time() - start)
+        self.parity ^= 1
+
+    def run(self, T, unroll=None):
+        r""" Run the elastic wave simulation until t = T and report the
+        time spent inspecting loop chains and the per-step cost of
+        recorded and replayed timesteps.
+        :param float T: The finish time of the simulation.
+        :param int unroll: The number of timesteps per chain, which
+            defaults to the unroll factor the solver was created with.
+        :returns: The final solution fields for velocity and stress."""
+        self.inspection_time = 0.0
+        if unroll is None:
+            unroll = self.unroll
+        elif self.tiling_mode is not None and unroll != self.unroll:
+            raise ValueError("Fusion and tiling require the unroll factor (%d) the halo was built for"
+                             % self.unroll)
+        start = time.time()
+        result = super(TilingElasticLF4, self).run(T, unroll)
+        if self.tiling_mode is not None:
+            elapsed = time.time() - start
+            log("Loop chain inspection: %.3f s, remaining run time: %.3f s"
+                % (self.inspection_time, elapsed - self.inspection_time))
+        if self.replay:
+            mean = lambda times: 1000.0 * sum(times) / max(len(times), 1)
+            log("Time per timestep: %.3f ms recorded (%.3f ms issuing parloops), %.3f ms replayed"
+                % (mean(self.step_times['record']), mean(self.step_times['issue']),
+                   mean(self.step_times['replay'])))
+        return result
 
     @property
     def loop_context(self):
@@ -509,7 +1877,20 @@ class TilingElasticLF4(ExplicitElasticLF4):
         from pyop2.fusion import loop_chain
         @contextmanager
         def tiling_loop_context():
-            with loop_chain("main1", tile_size=self.tile_size, num_unroll=self.num_unroll,
-                            mode=self.tiling_mode, extra_halo=self.extra_halo, partitioning='chunk'):
+            with loop_chain(self.chain_name,
+                            tile_size=self.tile_size,
+                            num_unroll=self.num_unroll,
+                            mode=self.tiling_mode,
+                            extra_halo=self.extra_halo,
+                            explicit=self.explicit_scheme,
+                            use_glb_maps=self.use_glb_maps,
+                            use_prefetch=self.use_prefetch,
+                            coloring=self.coloring,
+                            ignore_war=self.ignore_war,
+                            log=self.tiling_log,
+                            partitioning=self.partitioning):
                 yield
+                # Inspection takes place when the loop chain is closed
+                start = time.time()
+            self.inspection_time += time.time() - start
         return tiling_loop_context
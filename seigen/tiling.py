@@ -0,0 +1,234 @@
+import mpi4py
+
+from pyop2 import op2
+
+
+def fusion_depth(loops):
+    """
+    The number of solves a sequence of loops spans when fused, which
+    determines the depth of the halo required to tile it. This is one
+    more than the length of the longest chain of loops in the sequence
+    that indirectly read data written by a previous loop.
+
+    :arg loops: sequence of parloops
+    """
+    depths = {}
+    depth = 0
+    for loop in loops:
+        d = 0
+        for arg in loop.args:
+            if arg.access in (op2.READ, op2.RW) and id(arg.data) in depths:
+                d = max(d, depths[id(arg.data)] + (arg.map is not None))
+        for arg in loop.args:
+            if arg.access in (op2.WRITE, op2.INC, op2.RW):
+                depths[id(arg.data)] = max(depths.get(id(arg.data), 0), d)
+        depth = max(depth, d)
+    return depth + 1
+
+
+def loop_accesses(loops):
+    """
+    The datasets and maps a sequence of loops accesses, where each is
+    counted once. Indirect accesses are attributed to cells through the
+    smallest arity of the maps a dataset is accessed with, since
+    interior facet maps reach the nodes of two cells.
+
+    :arg loops: sequence of parloops
+    :returns: a dict mapping each dataset to a tuple ``(arity,
+        bytes_per_entry)``, and a dict mapping each map to its arity
+    """
+    datasets = {}
+    maps = {}
+    for loop in loops:
+        for arg in loop.args:
+            if not isinstance(arg.data, op2.Dat):
+                continue
+            arity = arg.map.arity if arg.map is not None else 1
+            key = id(arg.data)
+            datasets[key] = (min(datasets[key][0], arity) if key in datasets else arity,
+                             arg.data.cdim * arg.data.dtype.itemsize)
+            if arg.map is not None:
+                maps[id(arg.map)] = arity
+    return datasets, maps
+
+
+def working_set(datasets, maps):
+    """
+    The number of bytes of data and maps accessed per mesh cell.
+
+    :arg datasets: dict mapping datasets to ``(arity, bytes_per_entry)``
+    :arg maps: dict mapping maps to their arities
+    """
+    return (sum(arity * nbytes for arity, nbytes in datasets.values())
+            + sum(arity * 4 for arity in maps.values()))
+
+
+def cell_bytes(loops):
+    """
+    The number of bytes of data and maps a sequence of loops accesses
+    per mesh cell, see :func:`loop_accesses`.
+
+    :arg loops: sequence of parloops
+    """
+    return working_set(*loop_accesses(loops))
+
+
+def tile_cells(tile_size, num_solves, dimension):
+    """
+    The number of cells touched by a tile of a fused region. A tile is
+    approximated by a cube of ``tile_size`` cells, which each fused solve
+    extends by one layer of cells on all sides, as it reads the values of
+    neighbouring cells computed by the previous solve.
+
+    :arg tile_size: the number of cells per tile
+    :arg num_solves: the number of solves spanned by the fused region
+    :arg dimension: the spatial dimension of the mesh
+    """
+    side = tile_size ** (1.0 / dimension)
+    return int((side + 2 * (num_solves - 1)) ** dimension)
+
+
+def regions(loops, schedule):
+    """
+    Split a loop chain into the sequences of loops executed together
+    according to a fusion schedule, including unfused loops.
+
+    :arg loops: the loop chain
+    :arg schedule: list of ``(first_loop_index, last_loop_index, tile_size)``
+    """
+    fused = dict((first, last) for first, last, _ in schedule)
+    i = 0
+    while i < len(loops):
+        last = fused.get(i, i)
+        yield loops[i:last + 1]
+        i = last + 1
+
+
+def traffic(loops, schedule):
+    """
+    Estimate the memory traffic of one execution of a loop chain, in
+    bytes per cell, assuming that the data of each fused region is
+    streamed from memory once.
+
+    :arg loops: the loop chain
+    :arg schedule: list of ``(first_loop_index, last_loop_index, tile_size)``
+    """
+    return sum(cell_bytes(region) for region in regions(loops, schedule))
+
+
+def tile_footprint(loops, tile_size, dimension):
+    """
+    Estimate the working set of a single tile of a fused region, in
+    bytes, from the data accessed by its loops, the number of solves it
+    spans and the tile size.
+
+    :arg loops: the loops of the fused region
+    :arg tile_size: the number of cells per tile
+    :arg dimension: the spatial dimension of the mesh
+    """
+    return tile_cells(tile_size, fusion_depth(loops), dimension) * cell_bytes(loops)
+
+
+def derive_schemes(loops, max_solves):
+    """
+    Derive fusion schemes for a loop chain from the data dependencies of
+    its loops. For each limit on the number of fused solves, up to
+    ``max_solves``, the loops are greedily grouped into maximal regions
+    spanning no more solves than the limit.
+
+    The returned schemes have the format of the predefined fusion
+    schemes of ``tests/tiling``, with tile size multipliers of 1: ::
+
+         (num_solves, [(first_loop_index, last_loop_index, 1), ...])
+
+    :arg loops: the loop chain of a timestep
+    :arg max_solves: the number of solves the halo is deep enough for
+    """
+    schemes = []
+    for limit in range(1, max_solves + 1):
+        schedule = []
+        first = 0
+        while first < len(loops):
+            last = first
+            while last + 1 < len(loops) and fusion_depth(loops[first:last + 2]) <= limit:
+                last += 1
+            if last > first:
+                schedule.append((first, last, 1))
+            first = last + 1
+        if not schedule:
+            continue
+        num_solves = max(fusion_depth(loops[i:j + 1]) for i, j, _ in schedule)
+        if (num_solves, schedule) not in schemes:
+            schemes.append((num_solves, schedule))
+    return schemes
+
+
+def rank_schemes(loops, schemes, tile_size, dimension, cache_size=None):
+    """
+    Rank fusion schemes by their estimated memory traffic, discarding
+    those with a fused region whose tile footprint exceeds the cache.
+    If no scheme fits in the cache, all schemes are ranked.
+
+    :arg loops: the loop chain of a timestep
+    :arg schemes: list of ``(num_solves, schedule)`` tuples
+    :arg tile_size: the base tile size
+    :arg dimension: the spatial dimension of the mesh
+    :arg cache_size: the cache size in bytes, or None to not discard any scheme
+    """
+    def fits(scheme):
+        return all(tile_footprint(loops[i:j + 1], tile_size*k, dimension) <= cache_size
+                   for i, j, k in scheme[1])
+    if cache_size is not None and any(fits(s) for s in schemes):
+        schemes = [s for s in schemes if fits(s)]
+    return sorted(schemes, key=lambda s: traffic(loops, s[1]))
+
+
+class Autotuner(object):
+
+    """
+    Online search for the fastest of a set of loop chain configurations.
+
+    Each candidate configuration is used for ``steps`` consecutive
+    timesteps. The first of these includes the inspection of the loop
+    chain and is discarded, while the remaining ones are timed. Once all
+    candidates have been timed, the fastest is locked in.
+
+    :arg candidates: list of dicts of loop chain options
+    :arg steps: number of timesteps per candidate
+    :arg comm: the communicator over which timings are reduced
+    """
+
+    def __init__(self, candidates, steps, comm):
+        self.candidates = candidates
+        self.steps = max(steps, 2)
+        self.comm = comm
+        self.timings = [[] for _ in candidates]
+        self.step = 0
+        self.best = None
+
+    @property
+    def tuning(self):
+        return self.best is None
+
+    @property
+    def current(self):
+        """The index of the candidate to use for the next timestep."""
+        if self.best is not None:
+            return self.best
+        return self.step // self.steps
+
+    def record(self, elapsed):
+        """Record the runtime of a timestep using the current candidate.
+        Timings are reduced to their maximum over all ranks, so that all
+        ranks lock in the same configuration."""
+        elapsed = self.comm.allreduce(elapsed, op=mpi4py.MPI.MAX)
+        if self.step % self.steps:
+            self.timings[self.current].append(elapsed)
+        self.step += 1
+        if self.step == len(self.candidates)*self.steps:
+            self.best = self.mean.index(min(self.mean))
+
+    @property
+    def mean(self):
+        """The mean time per timestep of each candidate."""
+        return [sum(t) / max(len(t), 1) for t in self.timings]
@@ -6,12 +6,12 @@ from seigen import *
 
 class Eigenmode3DLF4():
 
-    def __init__(self, N, degree, dt, solver='explicit', output=True):
+    def __init__(self, N, degree, dt, solver='explicit', output=True, **kwargs):
         with timed_region('mesh generation'):
             self.mesh = UnitCubeMesh(N, N, N)
 
         self.elastic = ElasticLF4.create(self.mesh, "DG", degree, dimension=3,
-                                         solver=solver, output=output)
+                                         solver=solver, output=output, **kwargs)
 
         # Constants
         self.elastic.density = 1.0
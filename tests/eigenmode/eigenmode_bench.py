@@ -17,7 +17,8 @@ class EigenmodeBench(Benchmark):
     benchmark = 'EigenmodeLF4'
 
     def eigenmode(self, dim=3, N=3, degree=1, dt=0.125, T=2.0,
-                  solver='explicit', opt=2):
+                  solver='explicit', opt=2, precision='double', batch_width=0,
+                  layout='aos', flux='split'):
         self.series['np'] = op2.MPI.comm.size
         self.series['dim'] = dim
         self.series['size'] = N
@@ -25,6 +26,10 @@ class EigenmodeBench(Benchmark):
         self.series['solver'] = solver
         self.series['opt'] = opt
         self.series['degree'] = degree
+        self.series['precision'] = precision
+        self.series['batch_width'] = batch_width
+        self.series['layout'] = layout
+        self.series['flux'] = flux
 
         # If dt is supressed (<0) Infer it based on Courant number
         if dt < 0:
@@ -35,17 +40,29 @@ class EigenmodeBench(Benchmark):
         parameters["coffee"]["O3"] = opt >= 3
         parameters["coffee"]["O4"] = opt >= 4
 
+        # Options that only the PyOP2-level solvers support
+        kwargs = {} if precision == 'double' else {'precision': precision}
+        if batch_width:
+            kwargs['batch_width'] = batch_width
+        if layout != 'aos':
+            kwargs['layout'] = layout
+        # The flux formulation is supported by all solvers
+        if flux != 'split':
+            kwargs['flux'] = flux
+
         if dim == 2:
-            eigen = Eigenmode2DLF4(N, degree, dt, solver=solver, output=False)
+            eigen = Eigenmode2DLF4(N, degree, dt, solver=solver, output=False, **kwargs)
             u1, s1 = eigen.eigenmode2d(T=T)
         elif dim == 3:
-            eigen = Eigenmode3DLF4(N, degree, dt, solver=solver, output=False)
+            eigen = Eigenmode3DLF4(N, degree, dt, solver=solver, output=False, **kwargs)
             u1, s1 = eigen.eigenmode3d(T=T)
 
         for task, timer in get_timers(reset=True).items():
             self.register_timing(task, timer.total)
 
         self.meta['dofs'] = op2.MPI.comm.allreduce(eigen.elastic.S.dof_count, op=mpi4py.MPI.SUM)
+        self.meta['allocations'] = eigen.elastic.timestep_allocations
+        self.meta['field_memory'] = eigen.elastic.allocated_bytes
         try:
             with self.timed_region('compute_error'):
                 u_error, s_error = eigen.eigenmode_error(u1, s1)
@@ -0,0 +1,36 @@
+from eigenmode_2d import Eigenmode2DLF4
+from eigenmode_3d import Eigenmode3DLF4
+from firedrake import *
+from seigen import *
+from coffee.visitors import EstimateFlops
+import tsfc
+import argparse
+
+
+def rhs_flops(form):
+    """Estimate the flops of one invocation of each RHS kernel of a
+    form, keyed by integral type."""
+    flops = {}
+    for kernel in tsfc.compile_form(rhs(form), prefix="rhs"):
+        flops[kernel.integral_type] = flops.get(kernel.integral_type, 0) + EstimateFlops().visit(kernel.ast)
+    return flops
+
+
+if __name__ == '__main__':
+    op2.init(log_level='ERROR')
+    from ffc.log import set_level
+    set_level('ERROR')
+
+    p = argparse.ArgumentParser(description="Compare the RHS kernel flops of the split and consolidated fluxes")
+    p.add_argument('--dim', type=int, default=2, help="Spatial dimension")
+    p.add_argument('--degree', type=int, nargs='+', default=[1, 2, 3, 4], help="Polynomial degrees")
+    args = p.parse_args()
+
+    Eigenmode = Eigenmode2DLF4 if args.dim == 2 else Eigenmode3DLF4
+    for degree in args.degree:
+        for flux in ('split', 'consolidated'):
+            elastic = Eigenmode(2, degree, 0.1, output=False, flux=flux).elastic
+            for name, form in (('velocity', elastic.form_uh1), ('stress', elastic.form_stemp)):
+                flops = rhs_flops(form)
+                log("degree %d, %s flux, %s RHS: %s" % (degree, flux, name, ", ".join(
+                    "%s %d" % (itype, flops[itype]) for itype in sorted(flops))))
@@ -0,0 +1,64 @@
+from pybench import Benchmark
+from firedrake import *
+from firedrake.petsc import PETSc
+from pyop2 import Dat, DataSet
+from seigen import *
+import numpy as np
+import mpi4py
+
+parameters["pyop2_options"]["profiling"] = True
+
+
+def matrix_to_dat_percell(elastic, massmatrix, functionspace):
+    """The original block extraction, building one index set and one
+    sub-matrix per cell, kept here as a reference for the benchmark."""
+    arity = sum(functionspace.topological.dofs_per_entity)*functionspace.topological.dim
+    dat = Dat(DataSet(elastic.mesh.cell_set, arity*arity), dtype='double')
+    istart, iend = massmatrix.handle.getOwnershipRange()
+    idxs = [PETSc.IS().createGeneral(np.arange(i, i+arity, dtype=np.int32),
+                                     comm=PETSc.COMM_SELF)
+            for i in range(istart, iend, arity)]
+    submats = massmatrix.handle.getSubMatrices(idxs, idxs)
+    for i, m in enumerate(submats):
+        dat.data[i] = m[:, :].flatten()
+    return dat
+
+
+class InverseMassBench(Benchmark):
+    warmups = 1
+    repeats = 3
+
+    method = 'invmass'
+    benchmark = 'InverseMassSetup'
+
+    def invmass(self, dim=2, N=64, degree=1, method='batched'):
+        self.series['np'] = op2.MPI.comm.size
+        self.series['dim'] = dim
+        self.series['size'] = N
+        self.series['degree'] = degree
+        self.series['method'] = method
+
+        mesh = UnitSquareMesh(N, N) if dim == 2 else UnitCubeMesh(N, N, N)
+        elastic = ElasticLF4.create(mesh, "DG", degree, dimension=dim,
+                                    solver='parloop', output=False)
+        self.meta['cells'] = op2.MPI.comm.allreduce(mesh.cell_set.size, op=mpi4py.MPI.SUM)
+
+        with self.timed_region('setup'):
+            if method == 'batched':
+                elastic.assemble_inverse_mass(inner(elastic.w, elastic.u)*dx, elastic.U)
+                elastic.assemble_inverse_mass(inner(elastic.v, elastic.s)*dx, elastic.S)
+            else:
+                inverse = assemble(inner(elastic.w, elastic.u)*dx, inverse=True)
+                inverse.assemble()
+                matrix_to_dat_percell(elastic, inverse.M, elastic.U)
+                inverse = assemble(inner(elastic.v, elastic.s)*dx, inverse=True)
+                inverse.assemble()
+                matrix_to_dat_percell(elastic, inverse.M, elastic.S)
+
+
+if __name__ == '__main__':
+    op2.init(log_level='ERROR')
+    from ffc.log import set_level
+    set_level('ERROR')
+
+    InverseMassBench(N=64, degree=1).main()
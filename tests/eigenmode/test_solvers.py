@@ -0,0 +1,43 @@
+from eigenmode_2d import Eigenmode2DLF4
+from firedrake import Expression
+import numpy as np
+
+
+def run_eigenmode(N, degree, solver, absorption=None, **kwargs):
+    """Run the 2D eigenmode problem until T=5 and return the final
+    fields as arrays along with their errors against the exact solution.
+    An absorption expression may be given to damp part of the domain."""
+    dt = 0.5*(1.0/N)/(2.0**(degree-1))  # Courant number of 0.5
+    em = Eigenmode2DLF4(N, degree, dt, solver=solver, output=False, **kwargs)
+    if absorption is not None:
+        em.elastic.absorption = Expression(absorption)
+    u1, s1 = em.eigenmode2d(T=5.0)
+    return u1.dat.data_ro.copy(), s1.dat.data_ro.copy(), em.eigenmode_error(u1, s1)
+
+
+def test_fused_matches_explicit():
+    """Applying the inverse mass matrix inside the assembly kernels
+    gives the same fields and errors as the explicit solver."""
+    for degree in (1, 2):
+        u, s, errors = run_eigenmode(4, degree, 'explicit')
+        for kwargs in ({}, {'compact_invmass': True}):
+            u_f, s_f, errors_f = run_eigenmode(4, degree, 'fused', **kwargs)
+            assert np.allclose(u_f, u, rtol=1e-10, atol=1e-12)
+            assert np.allclose(s_f, s, rtol=1e-10, atol=1e-12)
+            assert np.allclose(errors_f, errors, rtol=1e-8)
+
+
+def test_subsets_match_unsplit():
+    """Assembling the absorption term over the absorbing cells only
+    gives the same fields as assembling it with the rest of the RHS."""
+    absorption = "x[0] < 0.25 ? 10.0 : 0.0"
+    for solver in ('parloop', 'fused'):
+        u, s, _ = run_eigenmode(4, 2, solver, absorption=absorption)
+        u_s, s_s, _ = run_eigenmode(4, 2, solver, absorption=absorption, subsets=True)
+        assert np.allclose(u_s, u, rtol=1e-10, atol=1e-12)
+        assert np.allclose(s_s, s, rtol=1e-10, atol=1e-12)
+
+
+if __name__ == '__main__':
+    test_fused_matches_explicit()
+    test_subsets_match_unsplit()
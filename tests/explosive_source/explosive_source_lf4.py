@@ -10,12 +10,12 @@ class ExplosiveSourceLF4():
         return RectangleMesh(int(Lx/h), int(Ly/h), Lx, Ly)
 
     def explosive_source_lf4(self, T=2.5, Lx=300.0, Ly=150.0, h=2.5,
-                             solver="explicit", output=True):
+                             solver="explicit", output=True, **kwargs):
 
         with timed_region('mesh generation'):
             mesh = self.generate_mesh()
             self.elastic = ElasticLF4.create(mesh, "DG", 2, dimension=2,
-                                             solver=solver, output=output)
+                                             solver=solver, output=output, **kwargs)
 
         # Constants
         self.elastic.density = 1.0
@@ -40,8 +40,6 @@ class ExplosiveSourceLF4():
         self.elastic.source = self.elastic.source_expression
 
         # Absorption
-        F = FunctionSpace(mesh, "DG", 4)
-        self.elastic.absorption_function = Function(F)
         self.elastic.absorption = Expression("x[0] <= 20 || x[0] >= 280 || x[1] <= 20.0 ? 1000 : 0")
 
         # Initial conditions